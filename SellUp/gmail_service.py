@@ -1,8 +1,6 @@
 import base64
 import os
 import pickle
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 
 # Пути для сохранения учетных данных и токена
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -17,6 +15,7 @@ def get_credentials():
             credentials = pickle.load(token)
     else:
         # Если токен не найден, проходим процесс авторизации
+        from google_auth_oauthlib.flow import InstalledAppFlow
         flow = InstalledAppFlow.from_client_secrets_file(GOOGLE_OAUTH2_CREDENTIALS_PATH, SCOPES)
         credentials = flow.run_local_server(port=8000)
         with open(token_path, 'wb') as token:
@@ -25,6 +24,7 @@ def get_credentials():
 
 # Функция для отправки сообщения
 def send_email():
+    from googleapiclient.discovery import build
     credentials = get_credentials()
     service = build('gmail', 'v1', credentials=credentials)
 
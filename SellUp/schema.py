@@ -0,0 +1,158 @@
+"""OpenAPI-схема: собирается один раз (при деплое или при первом обращении в процессе) и отдается как статика.
+
+drf_yasg импортируется только при генерации схемы и при открытии документации.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ARTIFACT_DIR': '',
+    'MAX_AGE': 3600,
+    'API_URL': '',
+}
+
+FORMATS = {
+    'json': 'application/json',
+    'yaml': 'application/yaml; charset=utf-8',
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+# Адрес с хешем содержимого не меняется, пока не изменится схема
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'OPENAPI_SCHEMA', {})}
+
+
+def _info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="SellUp API",
+        default_version='v1',
+        description="Документация SellUp API",
+    )
+
+
+@lru_cache(maxsize=None)
+def get_schema_view():
+    from drf_yasg.views import get_schema_view as build_schema_view
+    from rest_framework import permissions
+
+    return build_schema_view(_info(), public=True, permission_classes=[permissions.AllowAny])
+
+
+@lru_cache(maxsize=None)
+def _ui_view(renderer):
+    return get_schema_view().with_ui(renderer, cache_timeout=0)
+
+
+def lazy_schema_view(renderer):
+    """Аналог schema_view.with_ui(renderer) без импорта drf_yasg при загрузке URLconf"""
+    def view(request, *args, **kwargs):
+        return _ui_view(renderer)(request, *args, **kwargs)
+    return view
+
+
+def generate_schema():
+    """Полная генерация схемы обходом всех представлений: {'hash': ..., 'json': bytes, 'yaml': bytes}"""
+    from django.test import RequestFactory
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+    from rest_framework.request import Request
+
+    # Анонимный запрос без хоста: представления получают request как обычно, а адрес API
+    # берется из API_URL (пустой - схема относительна хоста, с которого ее загрузили)
+    request = Request(RequestFactory().get('/swagger.json'))
+    generator = OpenAPISchemaGenerator(_info(), url=get_config()['API_URL'])
+    schema = generator.get_schema(request=request, public=True)
+    documents = {
+        'json': OpenAPICodecJson(validators=[]).encode(schema),
+        'yaml': OpenAPICodecYaml(validators=[]).encode(schema),
+    }
+    documents['hash'] = hashlib.sha256(documents['json']).hexdigest()[:16]
+    return documents
+
+
+def write_artifact(documents, directory):
+    """openapi.<hash>.json/.yaml и manifest.json; файлы прежних сборок удаляются"""
+    os.makedirs(directory, exist_ok=True)
+    content_hash = documents['hash']
+    manifest = {'hash': content_hash}
+    for fmt in FORMATS:
+        name = f'openapi.{content_hash}.{fmt}'
+        with open(os.path.join(directory, name), 'wb') as artifact:
+            artifact.write(documents[fmt])
+        manifest[fmt] = name
+    # Манифест пишется последним и атомарно: читатель видит либо старую, либо новую сборку целиком
+    tmp_path = os.path.join(directory, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w') as tmp:
+        json.dump(manifest, tmp)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_NAME))
+
+    current = set(manifest.values())
+    for path in glob.glob(os.path.join(directory, 'openapi.*')):
+        if os.path.basename(path) not in current:
+            os.remove(path)
+    return manifest
+
+
+def load_artifact(directory):
+    """Схема из каталога сборки или None, если артефакта нет"""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+        documents = {'hash': manifest['hash']}
+        for fmt in FORMATS:
+            with open(os.path.join(directory, manifest[fmt]), 'rb') as artifact:
+                documents[fmt] = artifact.read()
+    except (OSError, ValueError, KeyError):
+        return None
+    return documents
+
+
+@lru_cache(maxsize=None)
+def get_schema_documents():
+    directory = get_config()['ARTIFACT_DIR']
+    documents = load_artifact(directory) if directory else None
+    if documents is None:
+        documents = generate_schema()
+        logger.info("Артефакт OpenAPI-схемы не найден, схема %s сгенерирована в процессе", documents['hash'])
+    return documents
+
+
+def _schema_response(request, fmt, **cache_control):
+    documents = get_schema_documents()
+    etag = f'"{documents["hash"]}"'
+    response = HttpResponse(documents[fmt], content_type=FORMATS[fmt])
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, **cache_control)
+    # If-None-Match с текущим хешем -> 304 с теми же ETag и Cache-Control
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+@require_safe
+def schema_document_view(request, format='.json'):
+    """/swagger.json и /swagger.yaml: max-age из настроек, затем перепроверка по ETag"""
+    return _schema_response(request, format.lstrip('.'), max_age=get_config()['MAX_AGE'])
+
+
+@require_safe
+def versioned_schema_view(request, content_hash, fmt):
+    """/openapi/<hash>.json: адрес меняется вместе со схемой, поэтому кешируется навсегда"""
+    if content_hash != get_schema_documents()['hash']:
+        raise Http404("Схема с таким хешем не найдена.")
+    return _schema_response(request, fmt, max_age=IMMUTABLE_MAX_AGE, immutable=True)
@@ -2,36 +2,28 @@
 
 from django.contrib import admin
 from django.urls import path, include, re_path
+from listings.metrics import metrics_view
 from listings.views import ConfirmEmailView, test_api
 from rest_framework.authtoken.views import obtain_auth_token
 
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
 from django.conf import settings
 from django.conf.urls.static import static
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="SellUp API",
-      default_version='v1',
-      description="Документация SellUp API",
-   ),
-   public=True,
-   permission_classes=[permissions.AllowAny],
-)
+from .schema import lazy_schema_view, schema_document_view, versioned_schema_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('listings.urls')),
     path('confirm-email/<str:token>/', ConfirmEmailView.as_view(), name='confirm-email'),
 
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_document_view, name='schema-json'),
+    re_path(r'^openapi/(?P<content_hash>[0-9a-f]+)\.(?P<fmt>json|yaml)$', versioned_schema_view,
+            name='schema-versioned'),
+    path('swagger/', lazy_schema_view('swagger'), name='schema-swagger-ui'),
+    path('redoc/', lazy_schema_view('redoc'), name='schema-redoc'),
     path('api-token-auth/', obtain_auth_token),
     path('api/test/', test_api),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""Асинхронные версии горячих эндпоинтов чтения (/api/async/...) для ASGI.
+
+Независимые запросы к БД одного эндпоинта выполняются параллельно (asyncio.gather) в потоках
+запроса (RequestPool). Асинхронный ORM Django 4.2 выполняет все запросы в одном потоке
+по очереди, поэтому здесь используются свои потоки. Формат ответов совпадает с синхронными
+эндпоинтами; список объявлений дополнительно разбит на страницы и содержит счетчики по категориям.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from django.db import connections
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework import exceptions, filters
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .authentication import CachedTokenAuthentication
+from .models import Category, Listing, Message, User
+from .projections import listing_values, project_listings, projections_enabled
+from .serializers import CategoryTreeSerializer, ListingSerializer, build_category_children
+from .throttling import IPThrottle, UserThrottle, scoped
+from .views import ListingViewSet, build_conversations, conversation_partner_queries, filter_listings, \
+    last_message_ids, with_listing_relations
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Больше параллельных запросов к БД ни одному эндпоинту не нужно
+POOL_THREADS = 3
+
+
+class RequestPool:
+    """Потоки для работы с БД в пределах одного запроса.
+
+    Вызовы, идущие одновременно, получают разные потоки (у каждого свое соединение), а
+    последующие вызовы переиспользуют уже открытые соединения. При выходе из async with
+    соединения закрываются один раз и потоки завершаются: между запросами открытых соединений
+    не остается ни при CONN_MAX_AGE=0 (ASGI), ни при постоянных соединениях.
+    """
+
+    def __init__(self, threads=POOL_THREADS):
+        self.threads = threads
+        self._lanes = []  # [исполнитель на один поток, число выполняемых вызовов]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        lanes, self._lanes = self._lanes, []
+        # Соединение закрывается в том же потоке, где было открыто
+        await asyncio.gather(*(asyncio.wrap_future(executor.submit(connections.close_all)) for executor, _ in lanes))
+        for executor, _ in lanes:
+            executor.shutdown(wait=False)
+
+    def _lane(self):
+        for lane in self._lanes:
+            if not lane[1]:
+                return lane
+        if len(self._lanes) < self.threads:
+            lane = [ThreadPoolExecutor(1, thread_name_prefix='async-view-db'), 0]
+            self._lanes.append(lane)
+            return lane
+        return min(self._lanes, key=lambda lane: lane[1])
+
+    async def run(self, func, *args, **kwargs):
+        """func(*args, **kwargs) в потоке запроса с текущими contextvars (реплики, замеры, request_id)"""
+        lane = self._lane()
+        lane[1] += 1
+        try:
+            call = partial(contextvars.copy_context().run, func, *args, **kwargs)
+            return await asyncio.wrap_future(lane[0].submit(call))
+        finally:
+            lane[1] -= 1
+
+
+def require_safe(view):
+    """Только GET/HEAD: декораторы django.views.decorators.http в Django 4.2 не поддерживают async-представления"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def json_response(data, status=200, headers=None):
+    # Тот же JSON-рендерер, что и у синхронных эндпоинтов DRF (REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'])
+    return HttpResponse(api_settings.DEFAULT_RENDERER_CLASSES[0]().render(data), status=status, headers=headers,
+                        content_type='application/json')
+
+
+def error_response(exc):
+    """Ответ на APIException в том же виде, что и у rest_framework.views.exception_handler"""
+    headers = {}
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        headers['WWW-Authenticate'] = CachedTokenAuthentication().authenticate_header(None)
+    if isinstance(exc, exceptions.Throttled) and exc.wait is not None:
+        headers['Retry-After'] = '%d' % float(exc.wait)
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(data, status=exc.status_code, headers=headers)
+
+
+async def throttle(pool, request, scope, base=IPThrottle):
+    throttle_instance = scoped(scope, base)()
+    if not await pool.run(throttle_instance.allow_request, request, None):
+        raise exceptions.Throttled(throttle_instance.wait())
+
+
+async def authenticate(pool, request):
+    """Пользователь по токену (как у MessageViewSet) или NotAuthenticated"""
+    result = await pool.run(CachedTokenAuthentication().authenticate, request)
+    if result is None:
+        raise exceptions.NotAuthenticated()
+    return result[0]
+
+
+def _page_params(params):
+    try:
+        limit = min(max(int(params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        offset = max(int(params.get('offset', 0)), 0)
+    except ValueError:
+        raise exceptions.ValidationError({'limit': "limit и offset должны быть целыми числами"})
+    return limit, offset
+
+
+def _filtered_listings(request):
+    queryset = filter_listings(Listing.objects.all(), request.GET)
+    return filters.SearchFilter().filter_queryset(Request(request), queryset, ListingViewSet)
+
+
+def _listing_page(queryset, limit, offset):
+    queryset = queryset.order_by('-created_at')
+    if projections_enabled():
+        return project_listings(listing_values(queryset)[offset:offset + limit])
+    return ListingSerializer(with_listing_relations(queryset)[offset:offset + limit], many=True).data
+
+
+def _category_facets(queryset):
+    rows = queryset.order_by().values('category_id').annotate(count=Count('id', distinct=True))
+    return {row['category_id']: row['count'] for row in rows if row['category_id'] is not None}
+
+
+@require_safe
+async def listing_list(request):
+    """Страница выдачи (?limit=, ?offset=, фильтры и search как у /api/listings/), count и
+    счетчики по категориям - три независимых запроса выполняются одновременно"""
+    async with RequestPool() as pool:
+        try:
+            await throttle(pool, request, 'listings')
+            limit, offset = _page_params(request.GET)
+            # Построение фильтра само читает дерево категорий, поэтому тоже уходит в пул
+            queryset = await pool.run(_filtered_listings, request)
+            results, count, facets = await asyncio.gather(
+                pool.run(_listing_page, queryset, limit, offset),
+                pool.run(queryset.count),
+                pool.run(_category_facets, queryset),
+            )
+        except exceptions.APIException as exc:
+            return error_response(exc)
+    return json_response({'count': count, 'results': results, 'facets': {'categories': facets}})
+
+
+def _listing_detail(pk):
+    listing = with_listing_relations(Listing.objects.all()).filter(pk=pk).first()
+    return ListingSerializer(listing).data if listing is not None else None
+
+
+@require_safe
+async def listing_detail(request, pk):
+    async with RequestPool() as pool:
+        try:
+            await throttle(pool, request, 'listing_detail')
+        except exceptions.APIException as exc:
+            return error_response(exc)
+        data = await pool.run(_listing_detail, pk)
+    if data is None:
+        return error_response(exceptions.NotFound())
+    return json_response(data)
+
+
+def _category_tree(roots, children):
+    return CategoryTreeSerializer(roots, many=True, context={'category_children': children}).data
+
+
+@require_safe
+async def category_tree(request):
+    """Дерево категорий как у /api/categories/: корни и карта потомков читаются одновременно"""
+    async with RequestPool() as pool:
+        try:
+            await throttle(pool, request, 'categories')
+        except exceptions.APIException as exc:
+            return error_response(exc)
+        roots, children = await asyncio.gather(
+            pool.run(lambda: list(Category.objects.filter(parent__isnull=True).prefetch_related('filters'))),
+            pool.run(build_category_children),
+        )
+        data = await pool.run(_category_tree, roots, children)
+    return json_response(data)
+
+
+@require_safe
+async def conversations(request):
+    """Диалоги как у /api/messages/conversations/: отправленные и полученные, затем сообщения
+    и собеседники - попарно одновременно"""
+    async with RequestPool() as pool:
+        try:
+            user = await authenticate(pool, request)
+            # Лимит по пользователю, как у MessageViewSet; DRF так же записывает его в request.user
+            request.user = user
+            await throttle(pool, request, 'messages', base=UserThrottle)
+        except exceptions.APIException as exc:
+            return error_response(exc)
+
+        sent, received = conversation_partner_queries(user)
+        sent, received = await asyncio.gather(pool.run(list, sent), pool.run(list, received))
+        last_ids = last_message_ids(sent, received)
+        messages, users = await asyncio.gather(
+            pool.run(Message.objects.in_bulk, list(last_ids.values())),
+            pool.run(User.objects.only('id', 'username').in_bulk, list(last_ids.keys())),
+        )
+        data = await pool.run(build_conversations, last_ids, messages, users)
+    return json_response(data)
@@ -0,0 +1,119 @@
+"""Аутентификация по токену с кешированием пользователя."""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .checks import is_process_local_cache
+from .metrics import record_cache
+from .replicas import pin_primary
+from .timing import timed
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'CACHE_TTL': 60,
+    'EXPIRE_AFTER': None,
+    # Кеш в памяти процесса (locmem) допустим только при одном процессе: разработка, тесты
+    'ALLOW_LOCAL_CACHE': False,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH', {})}
+
+
+def _cache():
+    return caches[get_config()['CACHE_ALIAS']]
+
+
+def caching_enabled():
+    """Сброс записей сигналами работает, только если кеш общий для всех воркеров.
+
+    В locmem другой воркер не узнал бы о смене пароля или деактивации и пускал бы
+    пользователя до CACHE_TTL, поэтому с таким кешем (без ALLOW_LOCAL_CACHE) кеширование выключено.
+    """
+    config = get_config()
+    if config['CACHE_TTL'] <= 0:
+        return False
+    return config['ALLOW_LOCAL_CACHE'] or not is_process_local_cache(config['CACHE_ALIAS'])
+
+
+def _token_cache_key(key):
+    # Сам токен в ключ кеша не попадает - в Redis/memcached видно только хеш
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def token_expires_at(token):
+    expire_after = get_config()['EXPIRE_AFTER']
+    if not expire_after:
+        return None
+    return token.created + timedelta(seconds=expire_after)
+
+
+def token_expired(token):
+    expires_at = token_expires_at(token)
+    return expires_at is not None and expires_at <= timezone.now()
+
+
+def invalidate_token(key):
+    if caching_enabled():
+        _cache().delete(_token_cache_key(key))
+
+
+def invalidate_user(user_id):
+    """Сбрасывает закешированного пользователя; токен пользователя ищется по маркеру в кеше, без запроса к БД"""
+    if not caching_enabled():
+        return
+    cache = _cache()
+    user_key = _user_cache_key(user_id)
+    token_key = cache.get(user_key)
+    if token_key:
+        cache.delete_many([token_key, user_key])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который кеширует (user, token) по ключу токена на CACHE_TTL секунд.
+
+    При попадании в кеш запрос к БД не выполняется. Записи сбрасываются сигналами (signals.py)
+    при сохранении пользователя и при удалении/перевыпуске токена; изменения через
+    QuerySet.update() сигналов не вызывают и видны не позже чем через CACHE_TTL.
+    Если задан TOKEN_AUTH['EXPIRE_AFTER'], токены старше этого числа секунд отклоняются.
+    С кешем в памяти процесса кеширование выключено (см. caching_enabled).
+    """
+
+    @timed('auth')
+    def authenticate_credentials(self, key):
+        cache = _cache() if caching_enabled() else None
+        cache_key = _token_cache_key(key)
+        cached = None
+        if cache is not None:
+            cached = cache.get(cache_key)
+            record_cache('auth', cached is not None)
+        if cached is not None:
+            user, token = cached
+        else:
+            # Только что выданного токена на реплике может еще не быть
+            with pin_primary():
+                user, token = super().authenticate_credentials(key)
+
+        if token_expired(token):
+            if cache is not None:
+                cache.delete(cache_key)
+            raise AuthenticationFailed("Срок действия токена истек.")
+
+        if cache is not None and cached is None:
+            ttl = get_config()['CACHE_TTL']
+            expires_at = token_expires_at(token)
+            if expires_at is not None:
+                ttl = min(ttl, int((expires_at - timezone.now()).total_seconds()) + 1)
+            if ttl > 0:
+                cache.set_many({cache_key: (user, token), _user_cache_key(user.pk): cache_key}, ttl)
+        return user, token
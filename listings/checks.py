@@ -0,0 +1,27 @@
+"""Проверки конфигурации кешей, через которые согласуются воркеры (manage.py check)."""
+from django.conf import settings
+from django.core import checks
+
+# Кеши, содержимое которых видно только текущему процессу
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def is_process_local_cache(alias):
+    """True, если запись в кеш alias не видна другим воркерам (locmem)"""
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES
+
+
+@checks.register(checks.Tags.caches)
+def check_replica_cache(app_configs, **kwargs):
+    """Маркер read-your-writes (replicas.ReplicaMiddleware) должен видеть любой воркер"""
+    from .replicas import get_config
+
+    config = get_config()
+    if not config['ALIASES'] or not is_process_local_cache(config['CACHE_ALIAS']):
+        return []
+    return [checks.Error(
+        f"READ_REPLICAS['CACHE_ALIAS'] = '{config['CACHE_ALIAS']}' - кеш в памяти процесса: после записи "
+        "следующий запрос того же API-клиента в другом воркере прочитал бы устаревшие данные с реплики.",
+        hint="Задайте общий кеш (CACHE_URL с Redis или memcached) или уберите DATABASE_REPLICA_URLS.",
+        id='listings.E001',
+    )]
@@ -0,0 +1,141 @@
+"""Сжатие ответов API (brotli/gzip) по Accept-Encoding.
+
+Статику сжимает whitenoise заранее, здесь - динамические ответы: JSON, схема OpenAPI.
+Тела меньше MIN_SIZE отдаются как есть - заголовки и CPU дороже экономии. Ответ, у
+которого уже есть сжатые варианты (response.precompressed, см. response_cache), не
+сжимается повторно - отдается подходящий готовый вариант.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+from .metrics import COMPRESSED_BYTES
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli указан в requirements.txt
+    brotli = None
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    # HTML (админка, Browsable API) не сжимается: в нем CSRF-токены, а сжатие секретов рядом
+    # с данными из запроса открывает атаку BREACH
+    'CONTENT_TYPES': ('application/json', 'application/yaml'),
+    # Уровни для сжатия на лету: быстро и почти так же плотно, как максимальные
+    'BROTLI_QUALITY': 4,
+    'GZIP_LEVEL': 6,
+    # Уровни для вариантов, которые сжимаются один раз и хранятся в кеше
+    'CACHED_BROTLI_QUALITY': 9,
+    'CACHED_GZIP_LEVEL': 9,
+}
+
+_CODING_RE = re.compile(r'^\s*([A-Za-z0-9*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'COMPRESSION', {})}
+
+
+def available_encodings():
+    """Поддерживаемые кодировки в порядке предпочтения сервера"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """Кодировка из Accept-Encoding (с учетом q и '*') или None, если клиенту подходит только identity"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        match = _CODING_RE.match(part)
+        if not match:
+            continue
+        try:
+            weights[match.group(1).lower()] = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+
+    best, best_weight = None, 0.0
+    for encoding in available_encodings() if encodings is None else encodings:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        # При равных весах выигрывает более ранняя (предпочтительная для сервера) кодировка
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body, encoding, cached=False):
+    config = get_config()
+    if encoding == 'br':
+        quality = config['CACHED_BROTLI_QUALITY' if cached else 'BROTLI_QUALITY']
+        return brotli.compress(body, quality=quality, mode=brotli.MODE_TEXT)
+    if encoding == 'gzip':
+        # mtime=0 - одинаковое тело дает одинаковые байты (стабильный ETag, повторяемые тесты)
+        return gzip.compress(body, compresslevel=config['CACHED_GZIP_LEVEL' if cached else 'GZIP_LEVEL'], mtime=0)
+    raise ValueError(f"Неизвестная кодировка: {encoding}")
+
+
+def precompress(body):
+    """Сжатые варианты тела для хранения в кеше: {кодировка: байты}; маленькие тела не сжимаются"""
+    config = get_config()
+    if not config['ENABLED'] or len(body) < config['MIN_SIZE']:
+        return {}
+    variants = {}
+    for encoding in available_encodings():
+        compressed = compress(body, encoding, cached=True)
+        if len(compressed) < len(body):
+            variants[encoding] = compressed
+    return variants
+
+
+def compressible(response, config):
+    if response.streaming or response.has_header('Content-Encoding') or response.status_code in (204, 304):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    return content_type in config['CONTENT_TYPES']
+
+
+class CompressionMiddleware:
+    """Сжимает ответы с подходящим Content-Type, если клиент принимает br или gzip.
+
+    Как и django.middleware.gzip.GZipMiddleware: Vary: Accept-Encoding, пересчет
+    Content-Length и ослабление ETag (сжатое тело побайтно отличается от исходного).
+    """
+
+    def __init__(self, get_response):
+        self.config = get_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not compressible(response, self.config) or len(response.content) < self.config['MIN_SIZE']:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        precompressed = getattr(response, 'precompressed', None)
+        encodings = tuple(precompressed) if precompressed is not None else available_encodings()
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), encodings)
+        if encoding is None:
+            return response
+
+        body = response.content
+        if precompressed is not None:
+            compressed, source = precompressed[encoding], 'cached'
+        else:
+            compressed, source = compress(body, encoding), 'fresh'
+            if len(compressed) >= len(body):
+                return response
+        COMPRESSED_BYTES.inc(len(body), encoding=encoding, source=source, stage='original')
+        COMPRESSED_BYTES.inc(len(compressed), encoding=encoding, source=source, stage='sent')
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,230 @@
+"""Буферизованные денормализованные счетчики (Listing.favorites_count).
+
+Буфер живет в памяти процесса: под gunicorn/uvicorn у каждого воркера свой. Приращения,
+накопленные до сброса (не больше FLUSH_SIZE операций и FLUSH_INTERVAL секунд), теряются,
+если воркер убит SIGKILL или OOM - atexit тогда не выполняется. Источник истины - таблица
+Favorites: reconcile_favorites_count() пересчитывает счетчики по ней. Сверка запускается
+в фоне раз в RECONCILE_INTERVAL секунд (по умолчанию раз в час; 0 - только командой
+manage.py reconcile_favorites_count), с общим кешем - одним воркером на интервал.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .response_cache import invalidate as invalidate_responses
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """Копит приращения счетчика по id и сбрасывает их одним UPDATE.
+
+    Горячие объявления не блокируются построчно на каждый лайк: дельты суммируются
+    в памяти и уходят пачкой по размеру буфера или по таймеру. Без буферизации
+    (BUFFERED=False) каждое приращение сразу пишется через F(). UPDATE сигналов не шлет:
+    если счетчик входит в закешированные ответы, после записи сбрасывается группа cache_group.
+    """
+
+    def __init__(self, model, field, buffered=True, flush_size=100, flush_interval=2.0, cache_group=None):
+        self.model = model
+        self.field = field
+        self.cache_group = cache_group
+        self.buffered = buffered
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = defaultdict(int)
+        self._pending_ops = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        self._last_flush = time.monotonic()
+
+    def add(self, pk, delta=1):
+        if not self.buffered:
+            self._apply({pk: delta})
+            return
+
+        with self._lock:
+            self._pending[pk] += delta
+            self._pending_ops += 1
+            due = (self._pending_ops >= self.flush_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+            if not due and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        with self._lock:
+            pending = {pk: delta for pk, delta in self._pending.items() if delta}
+            self._pending = defaultdict(int)
+            self._pending_ops = 0
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        return self._apply(pending)
+
+    def _incremented(self, delta):
+        # Счетчик не уходит ниже нуля (CHECK PositiveIntegerField), даже если часть приращений потеряна
+        return Greatest(F(self.field) + delta, Value(0))
+
+    def _apply(self, pending):
+        updated = self._write(pending)
+        if updated and self.cache_group:
+            try:
+                invalidate_responses(self.cache_group)
+            except Exception:
+                logger.exception("Не удалось сбросить кеш ответов %s после счетчика", self.cache_group)
+        return updated
+
+    def _write(self, pending):
+        """Пишет дельты и никогда не бросает исключение: сброс идет в on_commit уже закоммиченного
+        запроса и в потоке таймера. Сначала одним UPDATE, при ошибке - построчно; дельты строк,
+        которые записать не удалось, отбрасываются с записью в журнал (расхождение исправляет
+        reconcile_favorites_count)."""
+        increment = Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in pending.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        try:
+            with transaction.atomic():
+                return self.model.objects.filter(pk__in=pending).update(**{self.field: self._incremented(increment)})
+        except Exception:
+            logger.warning("Пакетный сброс счетчика %s.%s не удался, пишем построчно",
+                           self.model.__name__, self.field, exc_info=True)
+
+        updated = 0
+        for pk, delta in pending.items():
+            try:
+                with transaction.atomic():
+                    updated += self.model.objects.filter(pk=pk).update(**{self.field: self._incremented(delta)})
+            except Exception:
+                logger.exception("Дельта %+d счетчика %s.%s для id=%s отброшена",
+                                 delta, self.model.__name__, self.field, pk)
+        return updated
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Сброс счетчика %s.%s по таймеру не удался", self.model.__name__, self.field)
+        finally:
+            # Поток таймера держит собственное соединение с БД
+            connection.close()
+
+
+_favorites_counter = None
+_favorites_counter_lock = threading.Lock()
+_reconciler_started = False
+RECONCILE_LOCK_KEY = 'counters:favorites_count:reconcile'
+
+
+def get_favorites_counter():
+    global _favorites_counter
+    if _favorites_counter is None:
+        with _favorites_counter_lock:
+            if _favorites_counter is None:
+                from .models import Listing
+
+                config = getattr(settings, 'FAVORITES_COUNTER', {})
+                _favorites_counter = CounterBuffer(
+                    Listing, 'favorites_count',
+                    buffered=config.get('BUFFERED', True),
+                    flush_size=config.get('FLUSH_SIZE', 100),
+                    flush_interval=config.get('FLUSH_INTERVAL', 2.0),
+                    cache_group='listings',
+                )
+                atexit.register(_flush_at_exit)
+                _start_reconciler(config)
+    return _favorites_counter
+
+
+def reset_favorites_counter():
+    """Сброс синглтона (используется в тестах при смене настроек)"""
+    global _favorites_counter
+    _favorites_counter = None
+
+
+def _flush_at_exit():
+    if _favorites_counter is not None:
+        _favorites_counter.flush()
+
+
+def reconcile_favorites_count(batch_size=5000):
+    """Сверяет Listing.favorites_count с таблицей Favorites; возвращает число исправленных объявлений"""
+    from .models import Favorite, Listing
+
+    # Сначала сбрасываем накопленные в этом процессе приращения
+    get_favorites_counter().flush()
+
+    actual = Coalesce(
+        Subquery(
+            Favorite.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+            .annotate(n=Count('id')).values('n')
+        ),
+        Value(0),
+    )
+
+    last_id = Listing.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    fixed = 0
+    for start in range(0, last_id + 1, batch_size):
+        # Диапазоны по id держат блокировки короткими
+        fixed += Listing.objects.filter(pk__gte=start, pk__lt=start + batch_size).exclude(
+            favorites_count=actual
+        ).update(favorites_count=actual)
+    if fixed:
+        # UPDATE сигналов не шлет - счетчик входит в закешированную выдачу
+        invalidate_responses('listings')
+    return fixed
+
+
+def run_scheduled_reconcile(interval, alias='default'):
+    """Сверка по расписанию: ключ в кеше занимает первый воркер, остальные в этот интервал пропускают"""
+    if not caches[alias].add(RECONCILE_LOCK_KEY, 1, interval):
+        return None
+    fixed = reconcile_favorites_count()
+    if fixed:
+        logger.warning("Сверка favorites_count исправила объявлений: %s", fixed)
+    return fixed
+
+
+def _reconcile_forever(interval, alias):
+    while True:
+        time.sleep(interval)
+        try:
+            run_scheduled_reconcile(interval, alias)
+        except Exception:
+            logger.exception("Фоновая сверка favorites_count не удалась")
+        finally:
+            # Поток сверки держит собственное соединение с БД
+            connection.close()
+
+
+def _start_reconciler(config):
+    global _reconciler_started
+    interval = config.get('RECONCILE_INTERVAL', 3600)
+    if not interval or _reconciler_started:
+        return
+    _reconciler_started = True
+    threading.Thread(
+        target=_reconcile_forever, args=(interval, config.get('CACHE_ALIAS', 'default')),
+        name='favorites-count-reconcile', daemon=True,
+    ).start()
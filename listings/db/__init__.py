@@ -0,0 +1,31 @@
+"""Обертки стандартных бэкендов БД с метриками соединений (ENGINE подменяется в settings.py)."""
+import time
+
+from listings.metrics import DB_CONNECT_DURATION, DB_CONNECTIONS
+
+
+class InstrumentedConnectionMixin:
+    """Время установки соединения и события жизненного цикла: opened, reused, unusable, closed.
+
+    reused/unusable считаются проверкой CONN_HEALTH_CHECKS при первом обращении к сохраненному
+    соединению в запросе; доля opened среди всех событий показывает, как часто запрос платит
+    за подключение.
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        DB_CONNECT_DURATION.observe(time.perf_counter() - started, alias=self.alias)
+        DB_CONNECTIONS.inc(alias=self.alias, event='opened')
+
+    def close_if_health_check_failed(self):
+        checking = self.connection is not None and self.health_check_enabled and not self.health_check_done
+        super().close_if_health_check_failed()
+        if checking:
+            DB_CONNECTIONS.inc(alias=self.alias, event='reused' if self.connection is not None else 'unusable')
+
+    def close(self):
+        was_open = self.connection is not None
+        super().close()
+        if was_open and self.connection is None:
+            DB_CONNECTIONS.inc(alias=self.alias, event='closed')
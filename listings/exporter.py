@@ -0,0 +1,189 @@
+"""Потоковая выгрузка объявлений в JSONL/CSV."""
+import csv
+import json
+import zlib
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Listing, Image, ListingCategory
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+EXPORT_FIELDS = [
+    'id', 'title', 'description', 'price', 'address', 'created_at',
+    'user_id', 'category_id', 'attributes', 'favorites_count',
+]
+CSV_HEADER = EXPORT_FIELDS + ['images', 'categories']
+OUTPUT_CHUNK_BYTES = 64 * 1024
+
+
+def parse_moment(value, end_of_day=False):
+    """Дата или дата-время из query string; дата без времени - начало (или конец) дня"""
+    if not value:
+        return None
+    # parse_datetime на Python 3.11+ принимает и голую дату, поэтому дату проверяем первой
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.combine(day, dt_time.max if end_of_day else dt_time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f"Некорректная дата: {value}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def export_queryset(created_after=None, created_before=None):
+    queryset = Listing.objects.order_by('id')
+    if created_after:
+        queryset = queryset.filter(created_at__gte=created_after)
+    if created_before:
+        queryset = queryset.filter(created_at__lte=created_before)
+    return queryset
+
+
+def iter_listing_rows(queryset, chunk_size=2000):
+    """Строки объявлений чанками; изображения и категории догружаются пачками на чанк.
+
+    Обычно строки читаются серверным курсором (.iterator()). Под PgBouncer в режиме transaction
+    (DB_PGBOUNCER=1) серверные курсоры отключены, и .iterator() получил бы всю выборку в память
+    драйвера - тогда строки читаются постранично по id (export_queryset упорядочен по id).
+    """
+    rows = queryset.values(*EXPORT_FIELDS)
+    if connections[queryset.db].settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+        chunks = _keyset_chunks(rows, chunk_size)
+    else:
+        chunks = _cursor_chunks(rows, chunk_size)
+    for chunk in chunks:
+        yield from _attach_relations(chunk)
+
+
+def _cursor_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _keyset_chunks(rows, chunk_size):
+    last_id = None
+    while True:
+        page = rows if last_id is None else rows.filter(id__gt=last_id)
+        chunk = list(page[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1]['id']
+
+
+def _attach_relations(chunk):
+    ids = [row['id'] for row in chunk]
+    images = {}
+    for listing_id, url in Image.objects.filter(listing_id__in=ids).order_by('id').values_list('listing_id', 'url'):
+        images.setdefault(listing_id, []).append(url)
+    categories = {}
+    for listing_id, category_id in (ListingCategory.objects.filter(listing_id__in=ids)
+                                    .order_by('id').values_list('listing_id', 'category_id')):
+        categories.setdefault(listing_id, []).append(category_id)
+
+    for row in chunk:
+        row['images'] = images.get(row['id'], [])
+        row['categories'] = categories.get(row['id'], [])
+        yield row
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def render_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=_json_default) + '\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(
+            [_csv_value(row[field]) for field in EXPORT_FIELDS]
+            + ['|'.join(row['images']), '|'.join(str(pk) for pk in row['categories'])]
+        )
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_chunks(pieces, compress=False):
+    """Склеивает строки в блоки ~64 КБ и при необходимости сжимает их gzip на лету"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    for piece in pieces:
+        data = piece.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= OUTPUT_CHUNK_BYTES:
+            block = b''.join(buffer)
+            buffer, size = [], 0
+            if compressor is not None:
+                block = compressor.compress(block)
+            if block:
+                yield block
+    block = b''.join(buffer)
+    if compressor is not None:
+        block = compressor.compress(block) + compressor.flush()
+    if block:
+        yield block
+
+
+def export_stream(fmt, queryset, compress=False, chunk_size=2000):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неподдерживаемый формат: {fmt}")
+    render = render_jsonl if fmt == 'jsonl' else render_csv
+    return encode_chunks(render(iter_listing_rows(queryset, chunk_size)), compress=compress)
+
+
+async def aiter_chunks(chunks):
+    """Асинхронный поток блоков для StreamingHttpResponse под ASGI.
+
+    Синхронный итератор Django под ASGI сначала вычитывает целиком - вся выгрузка оказалась бы
+    в памяти. Здесь каждый блок вынимается отдельно в потоке, где живет соединение с БД
+    (thread_sensitive), поэтому курсор не переходит между потоками.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Клиент мог оборвать загрузку - курсор закрывается в том же потоке
+        await sync_to_async(chunks.close, thread_sensitive=True)()
@@ -0,0 +1,396 @@
+"""Потоковый массовый импорт объявлений из CSV/JSONL."""
+import csv
+import io
+import json
+import logging
+import math
+import re
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Category, FilterAttribute, Listing, PendingImage, Image
+from .metrics import observe_image_upload
+from .response_cache import invalidate as invalidate_responses
+from .timing import timed
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+MAX_IMAGES_PER_LISTING = 10
+MAX_PRICE = Decimal('99999999.99')  # max_digits=10, decimal_places=2
+TRUE_VALUES = {'1', 'true', 'yes', 'on', 'да'}
+FALSE_VALUES = {'0', 'false', 'no', 'off', 'нет', ''}
+_IMAGE_SPLIT_RE = re.compile(r'[\s|,]+')
+IMGBB_TIMEOUT = 30
+# Срок захвата элемента очереди: с запасом больше таймаута загрузки
+CLAIM_TTL = timedelta(minutes=5)
+
+
+class ImportFileError(ValueError):
+    """Файл целиком непригоден для чтения (кодировка, разметка CSV)"""
+
+
+class RowError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def detect_format(filename, explicit=None):
+    if explicit:
+        fmt = str(explicit).lower()
+        if fmt not in IMPORT_FORMATS:
+            raise ValueError(f"Неподдерживаемый формат: допустимые значения {', '.join(IMPORT_FORMATS)}")
+        return fmt
+    name = (filename or '').lower()
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    raise ValueError("Не удалось определить формат файла: ожидается .csv или .jsonl")
+
+
+def iter_rows(stream, fmt):
+    """Построчное чтение бинарного потока; в памяти только текущая строка.
+
+    Ошибка кодировки или разметки CSV поднимается как ImportFileError: строки до нее
+    уже могли быть импортированы.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Неподдерживаемый формат: {fmt}")
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        yield from _iter_text_rows(text, fmt)
+    except UnicodeDecodeError as e:
+        raise ImportFileError("Файл должен быть в кодировке UTF-8") from e
+    except csv.Error as e:
+        raise ImportFileError(f"Некорректный CSV: {e}") from e
+    text.detach()
+
+
+def _iter_text_rows(text, fmt):
+    if fmt == 'csv':
+        for line_no, row in enumerate(csv.DictReader(text), start=2):
+            yield line_no, row
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, RowError({'row': f"Некорректный JSON: {e.msg}"})
+                continue
+            if not isinstance(row, dict):
+                yield line_no, RowError({'row': "Ожидается JSON-объект"})
+                continue
+            yield line_no, row
+
+
+# Валидаторы атрибутов, скомпилированные из FilterAttribute категории
+def _select_validator(attribute):
+    options = {str(option): option for option in attribute.options or []}
+
+    def validate(value):
+        if str(value) not in options:
+            raise ValueError(f"допустимые значения: {', '.join(options)}")
+        return options[str(value)]
+    return validate
+
+
+def _number_validator(attribute):
+    low, high = attribute.min_value, attribute.max_value
+
+    def validate(value):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError("ожидается число")
+        # nan и inf проходят любые сравнения с границами, а JSON-поле их не принимает
+        if not math.isfinite(number):
+            raise ValueError("ожидается конечное число")
+        if low is not None and number < low:
+            raise ValueError(f"минимум {low}")
+        if high is not None and number > high:
+            raise ValueError(f"максимум {high}")
+        return int(number) if number.is_integer() else number
+    return validate
+
+
+def _checkbox_validator(attribute):
+    def validate(value):
+        if isinstance(value, bool):
+            return value
+        normalized = str(value).strip().lower()
+        if normalized in TRUE_VALUES:
+            return True
+        if normalized in FALSE_VALUES:
+            return False
+        raise ValueError("ожидается да/нет")
+    return validate
+
+
+def _text_validator(attribute):
+    def validate(value):
+        value = str(value)
+        if len(value) > 255:
+            raise ValueError("не длиннее 255 символов")
+        return value
+    return validate
+
+
+VALIDATOR_FACTORIES = {
+    'select': _select_validator,
+    'number': _number_validator,
+    'range': _number_validator,
+    'checkbox': _checkbox_validator,
+    'text': _text_validator,
+}
+
+
+def compile_schema(attributes):
+    return {
+        attribute.name: VALIDATOR_FACTORIES.get(attribute.attribute_type, _text_validator)(attribute)
+        for attribute in attributes
+    }
+
+
+class ListingImporter:
+    """Валидирует строки и пишет объявления пакетами bulk_create в отдельных транзакциях.
+
+    Ошибки по строкам передаются в error_sink(line_no, errors) и не накапливаются,
+    поэтому память не зависит от размера файла. URL изображений ставятся в очередь PendingImage.
+    Пакет, отвергнутый БД, пишется построчно: строки с ошибкой попадают в отчет, остальные
+    сохраняются. bulk_create не шлет post_save, поэтому кеш выдачи сбрасывается здесь же.
+    """
+
+    def __init__(self, user, batch_size=500, error_sink=None):
+        self.user = user
+        self.batch_size = batch_size
+        self.error_sink = error_sink
+        self._schemas = {}
+        self.stats = {'processed': 0, 'created': 0, 'failed': 0, 'images_queued': 0}
+
+    def run(self, rows):
+        batch = []
+        for line_no, row in rows:
+            self.stats['processed'] += 1
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                batch.append((line_no, self.build(row)))
+            except RowError as e:
+                self.fail(line_no, e.errors)
+                continue
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        return self.stats
+
+    def fail(self, line_no, errors):
+        self.stats['failed'] += 1
+        if self.error_sink is not None:
+            self.error_sink(line_no, errors)
+
+    def schema_for(self, category_id):
+        if category_id not in self._schemas:
+            category = Category.objects.filter(pk=category_id).first()
+            self._schemas[category_id] = None if category is None else compile_schema(
+                FilterAttribute.objects.filter(category_id=category_id)
+            )
+        return self._schemas[category_id]
+
+    def build(self, row):
+        errors = {}
+
+        title = str(row.get('title') or '').strip()
+        if not title:
+            errors['title'] = "Обязательное поле"
+        elif len(title) > 255:
+            errors['title'] = "Не длиннее 255 символов"
+
+        address = str(row.get('address') or '').strip()
+        if not address:
+            errors['address'] = "Обязательное поле"
+        elif len(address) > 255:
+            errors['address'] = "Не длиннее 255 символов"
+
+        price = None
+        try:
+            price = Decimal(str(row.get('price', '')).replace(',', '.').strip()).quantize(Decimal('0.01'))
+            if price < 0 or price > MAX_PRICE:
+                errors['price'] = "Недопустимая цена"
+        except (InvalidOperation, ValueError):
+            errors['price'] = "Ожидается число"
+
+        schema = None
+        try:
+            # Через str: 1.7 и True не превращаются молча в 1
+            category_id = int(str(row.get('category_id')))
+            schema = self.schema_for(category_id)
+            if schema is None:
+                errors['category_id'] = "Категория не найдена"
+        except (TypeError, ValueError):
+            errors['category_id'] = "Ожидается id категории"
+
+        attributes = {}
+        if schema is not None:
+            attributes, attribute_errors = self.validate_attributes(row, schema)
+            if attribute_errors:
+                errors['attributes'] = attribute_errors
+
+        images = row.get('images') or []
+        if isinstance(images, str):
+            images = [url for url in _IMAGE_SPLIT_RE.split(images) if url]
+        if not isinstance(images, list):
+            errors['images'] = "Ожидается список ссылок"
+        elif len(images) > MAX_IMAGES_PER_LISTING:
+            errors['images'] = f"Максимальное количество изображений - {MAX_IMAGES_PER_LISTING}"
+        elif any(not str(url).startswith(('http://', 'https://')) for url in images):
+            errors['images'] = "Ожидаются http(s) ссылки"
+
+        if errors:
+            raise RowError(errors)
+
+        listing = Listing(
+            user=self.user, title=title, description=row.get('description') or '', price=price,
+            address=address, category_id=category_id, attributes=attributes,
+        )
+        listing._import_images = images
+        return listing
+
+    @staticmethod
+    def validate_attributes(row, schema):
+        raw = row.get('attributes') or {}
+        if isinstance(raw, str):
+            try:
+                raw = json.loads(raw)
+            except json.JSONDecodeError:
+                return {}, "Некорректный JSON"
+        if not isinstance(raw, dict):
+            return {}, "Ожидается объект"
+        # В CSV атрибуты можно передавать и отдельными колонками attr:<имя>
+        for key, value in row.items():
+            if isinstance(key, str) and key.startswith('attr:') and value not in (None, ''):
+                raw[key[5:]] = value
+
+        values, errors = {}, {}
+        for name, value in raw.items():
+            validator = schema.get(name)
+            if validator is None:
+                errors[name] = "Атрибут не предусмотрен категорией"
+                continue
+            try:
+                values[name] = validator(value)
+            except ValueError as e:
+                errors[name] = str(e)
+        return values, errors
+
+    def flush(self, batch):
+        try:
+            self.write([listing for _, listing in batch])
+        except DatabaseError as e:
+            logger.warning("Пакет импорта отвергнут БД, запись по строкам: %s", e)
+            for line_no, listing in batch:
+                # id мог быть присвоен до отката пакета
+                listing.pk = None
+                try:
+                    self.write([listing])
+                except DatabaseError as e:
+                    logger.warning("Строка %s импорта отвергнута БД: %s", line_no, e)
+                    self.fail(line_no, {'row': "Строка отвергнута базой данных"})
+
+    def write(self, listings):
+        with transaction.atomic():
+            created = Listing.objects.bulk_create(listings)
+            pending = PendingImage.objects.bulk_create(
+                PendingImage(listing_id=listing.pk, source_url=url)
+                for listing in created for url in listing._import_images
+            )
+            transaction.on_commit(lambda: invalidate_responses('listings'))
+        self.stats['created'] += len(created)
+        self.stats['images_queued'] += len(pending)
+
+
+@timed('imgbb')
+@observe_image_upload('import')
+def upload_url_to_imgbb(url):
+    """Перезаливка внешнего изображения в imgBB по ссылке (API принимает URL вместо base64)"""
+    response = requests.post(
+        settings.IMGBB_UPLOAD_URL,
+        data={'key': settings.IMGBB_API_KEY, 'image': url},
+        timeout=IMGBB_TIMEOUT
+    )
+    response.raise_for_status()
+    data = response.json()
+    if not data.get('success', False):
+        raise ValueError(data.get('error', {}).get('message', 'Неизвестная ошибка imgBB'))
+    return data['data']['url']
+
+
+def _claim_pending_image(seen):
+    """Захватывает следующий элемент очереди коротким SELECT ... FOR UPDATE SKIP LOCKED.
+
+    Элемент переводится в processing до конца срока CLAIM_TTL, транзакция сразу фиксируется:
+    загрузка в imgBB идет без открытой транзакции и блокировки строки. Элементы упавшего
+    воркера снова доступны после истечения срока.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        item = (PendingImage.objects.select_for_update(skip_locked=True)
+                .filter(Q(status=PendingImage.STATUS_PENDING)
+                        | Q(status=PendingImage.STATUS_PROCESSING, locked_until__lt=now))
+                .exclude(pk__in=seen).order_by('id').first())
+        if item is None:
+            return None
+        item.status = PendingImage.STATUS_PROCESSING
+        item.attempts += 1
+        item.locked_until = now + CLAIM_TTL
+        item.save(update_fields=['status', 'attempts', 'locked_until'])
+    return item
+
+
+def _release(item, **fields):
+    """Обновляет захваченный элемент, если захват не перехвачен другим воркером после истечения срока"""
+    return PendingImage.objects.filter(
+        pk=item.pk, status=PendingImage.STATUS_PROCESSING, attempts=item.attempts
+    ).update(locked_until=None, **fields)
+
+
+def ingest_pending_images(limit=100, max_attempts=3):
+    """Обрабатывает до limit элементов очереди PendingImage; возвращает (загружено, ошибок).
+
+    Несколько воркеров могут разбирать очередь параллельно: каждый элемент захватывается
+    отдельно (_claim_pending_image), результат загрузки записывается после нее.
+    """
+    done = failed = 0
+    seen = []
+    for _ in range(limit):
+        item = _claim_pending_image(seen)
+        if item is None:
+            break
+        seen.append(item.pk)
+        try:
+            url = upload_url_to_imgbb(item.source_url)
+        except Exception as e:
+            logger.warning("Не удалось загрузить %s: %s", item.source_url, e)
+            status = PendingImage.STATUS_FAILED if item.attempts >= max_attempts else PendingImage.STATUS_PENDING
+            _release(item, status=status, last_error=str(e)[:1000])
+            failed += 1
+            continue
+
+        with transaction.atomic():
+            if not _release(item, status=PendingImage.STATUS_DONE, last_error=''):
+                logger.warning("Захват %s истек во время загрузки, результат отброшен", item.source_url)
+                continue
+            Image.objects.create(listing_id=item.listing_id, url=url, is_external=True)
+        done += 1
+    return done, failed
@@ -0,0 +1,152 @@
+"""Неблокирующее структурированное логирование: очередь, JSON, идентификатор запроса, сэмплирование."""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+access_logger = logging.getLogger('listings.access')
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Стандартные атрибуты LogRecord; все остальное попало в запись через extra.
+# request (объект HttpRequest из django.request) в JSON не переносится
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id', 'request',
+}
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет в запись request_id текущего запроса (или '-')"""
+
+    def filter(self, record):
+        # django.request пишет 4xx/5xx уже после выхода из middleware - берем id с самого запроса
+        record.request_id = (request_id_var.get()
+                             or getattr(getattr(record, 'request', None), 'request_id', None) or '-')
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей уровня max_level и ниже; более важные проходят всегда"""
+
+    def __init__(self, rate=1.0, max_level='INFO'):
+        super().__init__()
+        self.rate = float(rate)
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+
+    def filter(self, record):
+        if record.levelno > self.max_level or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON; поля из extra переносятся как есть"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            payload['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class QueueListenerHandler(QueueHandler):
+    """QueueHandler со своим QueueListener: поток запроса только кладет запись в очередь,
+    форматирование и запись в stream выполняются в фоновом потоке.
+
+    Очередь ограничена; при переполнении записи отбрасываются (счетчик dropped), а не
+    блокируют запрос. После fork (gunicorn --preload) слушатель перезапускается в дочернем процессе.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        self.target = logging.StreamHandler(stream)
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._pid = None
+        self.listener = None
+        super().__init__(None)
+        self._start()
+        atexit.register(self.stop)
+
+    def _start(self):
+        self._pid = os.getpid()
+        self.queue = queue.Queue(self.queue_size)
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Очередь внутрипроцессная, сериализация не нужна: только фиксируем текст сообщения,
+        # пока аргументы не изменились
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+class RequestIdMiddleware:
+    """Идентификатор запроса для корреляции логов: из X-Request-ID или новый; выборочный журнал доступа"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        incoming = request.headers.get('X-Request-ID', '')
+        request_id = incoming if _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        request.request_id = request_id
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            response['X-Request-ID'] = request_id
+            # Журнал доступа идет на INFO и сэмплируется фильтром в LOGGING
+            access_logger.info(
+                "%s %s %s", request.method, request.path, response.status_code,
+                extra={
+                    'method': request.method, 'path': request.path, 'status': response.status_code,
+                    'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+                    # Фазы запроса от ServerTimingMiddleware (listings.timing), если он включен
+                    'timings': getattr(request, 'server_timing', None),
+                },
+            )
+            return response
+        finally:
+            request_id_var.reset(token)
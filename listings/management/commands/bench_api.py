@@ -0,0 +1,164 @@
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.authtoken.models import Token
+
+from listings.models import User, Listing, Category, Message
+from listings.querycount import collect_queries
+from listings.seeding import DatasetSeeder, SeedConfig
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк горячих эндпоинтов API на сгенерированном наборе данных во временной БД. "
+            "Результат - JSON (перцентили латентности, запросы к БД, пропускная способность)")
+
+    def add_arguments(self, parser):
+        defaults = SeedConfig()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--listings', type=int, default=defaults.listings)
+        parser.add_argument('--category-depth', type=int, default=defaults.category_depth)
+        parser.add_argument('--category-fanout', type=int, default=defaults.category_fanout)
+        parser.add_argument('--reviews', type=int, default=defaults.reviews)
+        parser.add_argument('--threads', type=int, default=defaults.threads)
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--requests', type=int, default=50, help="Замеров на эндпоинт")
+        parser.add_argument('--warmup', type=int, default=5, help="Прогревочных запросов на эндпоинт")
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help="Только указанные эндпоинты")
+        parser.add_argument('--output', help="Файл для JSON-отчета (по умолчанию stdout)")
+        parser.add_argument('--keepdb', action='store_true', help="Не удалять временную БД после прогона")
+
+    def handle(self, *args, **options):
+        config = SeedConfig(
+            users=options['users'], listings=options['listings'],
+            category_depth=options['category_depth'], category_fanout=options['category_fanout'],
+            reviews=options['reviews'], threads=options['threads'], seed=options['seed'],
+        )
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            self.stderr.write("Генерация данных...")
+            started = time.perf_counter()
+            dataset = DatasetSeeder(config, stdout=self.stderr).run()
+            dataset['seed_seconds'] = round(time.perf_counter() - started, 2)
+
+            results = {}
+            # Все запросы идут с одного IP - лимиты частоты исказили бы замеры; кеш готовых ответов
+            # отдавал бы повторы без обращения к БД, а замеряется сама обработка запроса
+            with override_settings(THROTTLING={**getattr(settings, 'THROTTLING', {}), 'ENABLED': False},
+                                   RESPONSE_CACHE={**getattr(settings, 'RESPONSE_CACHE', {}), 'ENABLED': False}):
+                for name, path, headers in self.endpoints():
+                    if options['endpoints'] and name not in options['endpoints']:
+                        continue
+                    self.stderr.write(f"{name}: {path}")
+                    results[name] = self.measure(path, headers, options['requests'], options['warmup'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'requests_per_endpoint': options['requests'],
+            },
+            'dataset': dataset,
+            'results': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as report_file:
+                report_file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def endpoints(self):
+        user = User.objects.filter(sent_messages__isnull=False).order_by('pk').first() or User.objects.order_by('pk').first()
+        token, _ = Token.objects.get_or_create(user=user)
+        auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        listing = Listing.objects.order_by('pk').first()
+        root = Category.objects.filter(parent__isnull=True).order_by('pk').first()
+        other = Message.objects.filter(sender=user).values_list('receiver_id', flat=True).first()
+
+        return [
+            ('listing-browse', '/api/listings/', {}),
+            ('listing-search', '/api/listings/?search=%D0%BF%D1%80%D0%BE%D0%B4%D0%B0%D0%BC', {}),
+            ('listing-category', f'/api/listings/?category={root.id}&price_min=100&price_max=2000', {}),
+            ('listing-detail', f'/api/listings/{listing.id}/', {}),
+            ('category-tree', '/api/categories/', {}),
+            ('conversations', '/api/messages/conversations/', auth),
+            ('message-thread', f'/api/messages/?user_id={other}', auth),
+            ('favorites', '/api/favorites/', auth),
+            ('favorites-compact', '/api/favorites/compact/', auth),
+            ('my-favorites', '/api/my-favorites/', auth),
+            ('reviews', f'/api/reviews/?reviewed={user.id}', {}),
+        ]
+
+    def measure(self, path, headers, requests, warmup):
+        client = Client()
+        for _ in range(warmup):
+            client.get(path, **headers)
+
+        latencies = []
+        queries = 0
+        db_time = 0.0
+        size = 0
+        status = None
+        started = time.perf_counter()
+        for _ in range(requests):
+            with collect_queries() as collector:
+                request_started = time.perf_counter()
+                response = client.get(path, **headers)
+                latencies.append((time.perf_counter() - request_started) * 1000)
+            queries += collector.count
+            db_time += collector.duration
+            size = len(response.content)
+            status = response.status_code
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'status': status,
+            'requests': requests,
+            'response_bytes': size,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50), 3),
+                'p90': round(percentile(latencies, 0.90), 3),
+                'p99': round(percentile(latencies, 0.99), 3),
+                'mean': round(sum(latencies) / requests, 3),
+                'max': round(latencies[-1], 3),
+            },
+            'queries_per_request': round(queries / requests, 2),
+            'db_ms_per_request': round(db_time * 1000 / requests, 3),
+            'throughput_rps': round(requests / elapsed, 2),
+        }
@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.core.handlers.base import BaseHandler
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+from listings.management.commands.bench_api import percentile
+
+
+class Command(BaseCommand):
+    help = ("Накладные расходы на подключение к БД: цикл запросов (сигналы request_started/finished, "
+            "как в обработчике Django, и один SELECT 1) без постоянных соединений и с ними")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Запросов на режим")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--max-age', type=int, default=60, help="CONN_MAX_AGE для режима persistent")
+        parser.add_argument('--no-health-checks', action='store_true', help="Без CONN_HEALTH_CHECKS")
+
+    def handle(self, *args, requests=200, database=DEFAULT_DB_ALIAS, max_age=60, **options):
+        connection = connections[database]
+        original = {key: connection.settings_dict[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        results = {}
+        try:
+            for mode, settings_override in (
+                ('per_request', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+                ('persistent', {'CONN_MAX_AGE': max_age, 'CONN_HEALTH_CHECKS': not options['no_health_checks']}),
+            ):
+                connection.close()
+                connection.settings_dict.update(settings_override)
+                results[mode] = self.measure(connection, requests)
+        finally:
+            connection.close()
+            connection.settings_dict.update(original)
+
+        per_request, persistent = results['per_request'], results['persistent']
+        results['saved_ms_per_request'] = round(per_request['mean_ms'] - persistent['mean_ms'], 3)
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+
+    def measure(self, connection, requests):
+        opened = []
+
+        def on_created(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(on_created)
+        durations = []
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                # close_old_connections подписан на оба сигнала - как при обработке настоящего запроса
+                request_started.send(sender=BaseHandler)
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                request_finished.send(sender=BaseHandler)
+                durations.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection_created.disconnect(on_created)
+
+        durations.sort()
+        return {
+            'requests': requests,
+            'connections_opened': opened.count(connection.alias),
+            'mean_ms': round(sum(durations) / len(durations), 3),
+            'p50_ms': round(percentile(durations, 0.5), 3),
+            'p95_ms': round(percentile(durations, 0.95), 3),
+        }
@@ -0,0 +1,87 @@
+import io
+import json
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from listings.renderers import FastJSONParser, FastJSONRenderer, orjson
+
+WORDS = ('продам', 'срочно', 'отличное', 'состояние', 'торг', 'доставка', 'новый', 'гарантия', 'Омск', 'Томск')
+
+
+def listing_payload(index, rng, raw=False):
+    """Объявление в форме ListingSerializer. raw=True - значения как из values(): Decimal и datetime
+    вместо строк, которые выдает сериализатор"""
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=rng.randrange(10 ** 7))
+    price = Decimal(rng.randrange(100, 10 ** 7)) / 100
+    category = {'id': rng.randrange(1, 200), 'name': rng.choice(WORDS).title(), 'parent': rng.randrange(1, 50)}
+    return {
+        'id': index,
+        'title': ' '.join(rng.choices(WORDS, k=4)),
+        'description': ' '.join(rng.choices(WORDS, k=60)),
+        'price': price if raw else str(price),
+        'address': f'г. {rng.choice(WORDS[-2:])}, ул. Ленина, {rng.randrange(1, 200)}',
+        'created_at': created_at if raw else created_at.isoformat().replace('+00:00', 'Z'),
+        'user': {
+            'id': rng.randrange(1, 10 ** 5), 'username': f'user{index}', 'email': f'user{index}@example.com',
+            'phone_number': '+7900' + str(rng.randrange(10 ** 6, 10 ** 7)), 'rating': round(rng.uniform(1, 5), 2),
+        },
+        'images': [{'id': index * 10 + n, 'url': f'https://i.ibb.co/{index}/{n}.jpg'} for n in range(rng.randrange(1, 6))],
+        'categories': [{'id': index, 'category': category}],
+        'category': category,
+        'attributes': {'Пробег': rng.randrange(10 ** 5), 'Цвет': rng.choice(WORDS), 'Новый': rng.random() < 0.5},
+        'filters': [
+            {'id': n, 'name': f'Фильтр {n}', 'attribute_type': 'select', 'options': ['a', 'b', 'c'],
+             'min_value': None, 'max_value': None, 'unit': ''}
+            for n in range(3)
+        ],
+        'favorites_count': rng.randrange(100),
+    }
+
+
+class Command(BaseCommand):
+    help = ("Микробенчмарк JSON: стандартные JSONRenderer/JSONParser DRF против FastJSONRenderer/"
+            "FastJSONParser (orjson) на страницах объявлений разного размера")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='20,100,1000', help="Размеры страниц через запятую")
+        parser.add_argument('--repeat', type=int, default=5, help="Повторов (берется лучший)")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, sizes='20,100,1000', repeat=5, seed=42, **options):
+        if orjson is None:
+            raise CommandError("orjson не установлен - FastJSONRenderer работает через стандартный json")
+
+        rng = random.Random(seed)
+        report = {'orjson': orjson.__version__, 'results': []}
+        for size in (int(value) for value in sizes.split(',')):
+            for kind in ('serialized', 'raw'):
+                page = [listing_payload(index, rng, raw=kind == 'raw') for index in range(size)]
+                report['results'].append(self.compare(size, kind, page, repeat))
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+    def compare(self, size, kind, page, repeat):
+        stdlib_body = JSONRenderer().render(page)
+        fast_body = FastJSONRenderer().render(page)
+        if stdlib_body != fast_body:
+            raise CommandError(f"Вывод рендереров различается: {size} объявлений, {kind}")
+
+        number = max(1, 2000 // size)
+        result = {'listings': size, 'payload': kind, 'bytes': len(stdlib_body)}
+        for name, func in (
+            ('render_stdlib', lambda: JSONRenderer().render(page)),
+            ('render_fast', lambda: FastJSONRenderer().render(page)),
+            ('parse_stdlib', lambda: JSONParser().parse(io.BytesIO(stdlib_body))),
+            ('parse_fast', lambda: FastJSONParser().parse(io.BytesIO(stdlib_body))),
+        ):
+            best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+            result[f'{name}_ms'] = round(best * 1000, 3)
+        result['render_speedup'] = round(result['render_stdlib_ms'] / result['render_fast_ms'], 1)
+        result['parse_speedup'] = round(result['parse_stdlib_ms'] / result['parse_fast_ms'], 1)
+        return result
+
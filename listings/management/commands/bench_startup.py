@@ -0,0 +1,97 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# То, что выполняет холодный воркер до ответа на первый запрос: загрузка WSGI-приложения
+# (settings, приложения, middleware) и корневого URLconf со всеми представлениями
+STARTUP_SNIPPET = """
+import os, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SellUp.settings')
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - started)
+"""
+
+
+def parse_importtime(output):
+    """Строки -X importtime: 'import time: self [us] | cumulative | имя' -> [(имя, self_us, cumulative_us)]"""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+class Command(BaseCommand):
+    help = ("Замер холодного старта: время загрузки WSGI-приложения и URLconf в новом процессе "
+            "и время импорта по модулям (python -X importtime)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Число запусков (берется медиана)")
+        parser.add_argument('--top', type=int, default=25, help="Сколько самых дорогих модулей показать")
+        parser.add_argument('--json', action='store_true', help="Вывести отчет в JSON")
+
+    def handle(self, *args, runs=5, top=25, **options):
+        wall_times = []
+        modules = []
+        for _ in range(runs):
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', STARTUP_SNIPPET],
+                cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "Ошибка запуска")
+            wall_times.append(float(result.stdout.strip().splitlines()[-1]))
+            modules = parse_importtime(result.stderr)
+
+        # По модулям - последний прогон; по пакетам верхнего уровня - сумма собственного времени
+        packages = {}
+        for name, self_us, _ in modules:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + self_us
+
+        report = {
+            'runs': runs,
+            'startup_seconds': {
+                'median': round(statistics.median(wall_times), 4),
+                'min': round(min(wall_times), 4),
+                'max': round(max(wall_times), 4),
+            },
+            'modules_imported': len(modules),
+            'import_self_ms_total': round(sum(self_us for _, self_us, _ in modules) / 1000, 1),
+            'top_cumulative_ms': [
+                {'module': name, 'cumulative_ms': round(cumulative / 1000, 1), 'self_ms': round(self_us / 1000, 1)}
+                for name, self_us, cumulative in sorted(modules, key=lambda m: -m[2])[:top]
+            ],
+            'top_packages_ms': [
+                {'package': package, 'self_ms': round(total / 1000, 1)}
+                for package, total in sorted(packages.items(), key=lambda p: -p[1])[:top]
+            ],
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        startup = report['startup_seconds']
+        self.stdout.write(
+            f"Холодный старт: медиана {startup['median'] * 1000:.0f} мс "
+            f"(мин {startup['min'] * 1000:.0f}, макс {startup['max'] * 1000:.0f}), "
+            f"модулей {report['modules_imported']}, импорт {report['import_self_ms_total']:.0f} мс"
+        )
+        self.stdout.write("\nМодули (накопительно, мс):")
+        for row in report['top_cumulative_ms']:
+            self.stdout.write(f"  {row['cumulative_ms']:>8.1f}  {row['self_ms']:>7.1f}  {row['module']}")
+        self.stdout.write("\nПакеты (собственное время, мс):")
+        for row in report['top_packages_ms']:
+            self.stdout.write(f"  {row['self_ms']:>8.1f}  {row['package']}")
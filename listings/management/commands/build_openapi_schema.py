@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from SellUp.schema import generate_schema, get_config, load_artifact, write_artifact
+
+
+class Command(BaseCommand):
+    help = ("Генерирует OpenAPI-схему и сохраняет ее как статический артефакт openapi.<hash>.json/.yaml. "
+            "Запускается при деплое, чтобы воркеры не строили схему сами")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help="Каталог (по умолчанию OPENAPI_SCHEMA['ARTIFACT_DIR'])")
+        parser.add_argument('--check', action='store_true',
+                            help="Не писать файлы, а завершиться с ошибкой, если артефакт устарел")
+
+    def handle(self, *args, output=None, check=False, **options):
+        directory = output or get_config()['ARTIFACT_DIR']
+        if not directory:
+            raise CommandError("Не задан каталог: --output или OPENAPI_SCHEMA['ARTIFACT_DIR']")
+
+        documents = generate_schema()
+        if check:
+            current = load_artifact(directory)
+            if current is None or current['hash'] != documents['hash']:
+                raise CommandError(f"Артефакт схемы устарел: ожидается {documents['hash']}, "
+                                   f"в каталоге {current['hash'] if current else 'нет сборки'}")
+            self.stdout.write(f"Артефакт схемы актуален: {documents['hash']}")
+            return
+
+        manifest = write_artifact(documents, directory)
+        self.stdout.write(f"Схема {manifest['hash']} сохранена в {directory}: {manifest['json']}, {manifest['yaml']}")
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.exporter import EXPORT_FORMATS, export_queryset, export_stream, parse_moment
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка объявлений в JSONL/CSV (серверный курсор, память не зависит от объема)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl')
+        parser.add_argument('--output', help="Файл для выгрузки (по умолчанию stdout)")
+        parser.add_argument('--gzip', action='store_true', help="Сжимать вывод gzip")
+        parser.add_argument('--created-after', help="Дата или дата-время ISO 8601 (включительно)")
+        parser.add_argument('--created-before', help="Дата или дата-время ISO 8601 (включительно)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            created_after = parse_moment(options['created_after'])
+            created_before = parse_moment(options['created_before'], end_of_day=True)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        stream = export_stream(
+            options['format'], export_queryset(created_after, created_before),
+            compress=options['gzip'], chunk_size=options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for block in stream:
+                    output.write(block)
+        else:
+            for block in stream:
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
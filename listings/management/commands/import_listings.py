@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.importer import IMPORT_FORMATS, ImportFileError, ListingImporter, detect_format, iter_rows
+from listings.models import User
+
+
+class Command(BaseCommand):
+    help = "Массовый импорт объявлений из CSV/JSONL (потоково, пакетами bulk_create)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к файлу .csv или .jsonl")
+        parser.add_argument('--user', required=True, help="Email или id владельца объявлений")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Формат (по умолчанию по расширению)")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--errors', help="Файл JSONL для отчета об ошибках по строкам")
+
+    def handle(self, *args, path, user, format=None, batch_size=500, errors=None, **options):
+        lookup = {'pk': user} if user.isdigit() else {'email': user}
+        owner = User.objects.filter(**lookup).first()
+        if owner is None:
+            raise CommandError(f"Пользователь {user} не найден")
+
+        try:
+            fmt = detect_format(path, format)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        error_file = open(errors, 'w', encoding='utf-8') if errors else None
+
+        def error_sink(line_no, row_errors):
+            if error_file is not None:
+                error_file.write(json.dumps({'row': line_no, 'errors': row_errors}, ensure_ascii=False) + '\n')
+            else:
+                self.stderr.write(f"Строка {line_no}: {json.dumps(row_errors, ensure_ascii=False)}")
+
+        importer = ListingImporter(owner, batch_size=batch_size, error_sink=error_sink)
+        try:
+            with open(path, 'rb') as stream:
+                stats = importer.run(iter_rows(stream, fmt))
+        except ImportFileError as e:
+            raise CommandError(f"{e}; импортировано до ошибки: {json.dumps(importer.stats, ensure_ascii=False)}")
+        finally:
+            if error_file is not None:
+                error_file.close()
+
+        self.stdout.write(self.style.SUCCESS(json.dumps(stats, ensure_ascii=False)))
+        if stats['images_queued']:
+            self.stdout.write("Изображения поставлены в очередь: запустите manage.py ingest_images")
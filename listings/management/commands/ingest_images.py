@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.importer import ingest_pending_images
+from listings.models import PendingImage
+
+
+class Command(BaseCommand):
+    help = "Перезаливает в imgBB изображения из очереди PendingImage (после массового импорта)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=3)
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно, опрашивая очередь")
+        parser.add_argument('--sleep', type=float, default=5.0, help="Пауза между опросами пустой очереди, с")
+
+    def handle(self, *args, batch_size=100, max_attempts=3, loop=False, sleep=5.0, **options):
+        while True:
+            done, failed = ingest_pending_images(limit=batch_size, max_attempts=max_attempts)
+            if done or failed:
+                self.stdout.write(f"Загружено: {done}, ошибок: {failed}")
+            if not loop:
+                break
+            if not done and not failed:
+                time.sleep(sleep)
+
+        pending = PendingImage.objects.filter(status=PendingImage.STATUS_PENDING).count()
+        self.stdout.write(self.style.SUCCESS(f"В очереди осталось: {pending}"))
@@ -0,0 +1,82 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from listings.models import User, EmailConfirmation, EmailConfirmationToken, PasswordResetToken
+from listings.tokens import PASSWORD_RESET_TOKEN_TTL
+
+
+class Command(BaseCommand):
+    help = ("Удаляет просроченные и использованные токены подтверждения почты и сброса пароля. "
+            "Работает небольшими пакетами, каждый в своей транзакции, чтобы не держать блокировки")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Пауза между пакетами, с")
+        parser.add_argument('--email-ttl-days', type=int, default=7,
+                            help="Срок жизни записей EmailConfirmation/EmailConfirmationToken")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать")
+
+    def handle(self, *args, batch_size=1000, sleep=0.0, email_ttl_days=7, dry_run=False, **options):
+        self.batch_size = batch_size
+        self.sleep = sleep
+        self.dry_run = dry_run
+        now = timezone.now()
+        email_expired = now - timedelta(days=email_ttl_days)
+        reset_expired = now - PASSWORD_RESET_TOKEN_TTL
+
+        stale_email = Q(created_at__lt=email_expired) | Q(user__email_verified=True)
+        self.report('EmailConfirmation', self.delete_batched(EmailConfirmation.objects.filter(stale_email)))
+        self.report('EmailConfirmationToken', self.delete_batched(EmailConfirmationToken.objects.filter(stale_email)))
+        self.report('PasswordResetToken', self.delete_batched(
+            PasswordResetToken.objects.filter(Q(is_used=True) | Q(created_at__lt=reset_expired))
+        ))
+
+        # Токены в самой таблице Users не удаляются, а обнуляются
+        self.report('User.password_reset_token', self.clear_batched(
+            User.objects.filter(password_reset_token__isnull=False).filter(
+                Q(password_reset_token_created__lt=reset_expired) | Q(password_reset_token_created__isnull=True)
+            ),
+            password_reset_token=None, password_reset_token_created=None,
+        ))
+        self.report('User.email_verification_token', self.clear_batched(
+            User.objects.filter(email_verification_token__isnull=False, email_verified=True),
+            email_verification_token=None,
+        ))
+
+    def report(self, name, count):
+        verb = "К удалению" if self.dry_run else "Очищено"
+        self.stdout.write(f"{name}: {verb} {count}")
+
+    def batches(self, queryset):
+        """Пакеты pk; условие перепроверяется при каждой выборке, так что обработанные строки не повторяются"""
+        while True:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                return
+            yield pks
+            if self.sleep:
+                time.sleep(self.sleep)
+
+    def delete_batched(self, queryset):
+        if self.dry_run:
+            return queryset.count()
+        total = 0
+        for pks in self.batches(queryset):
+            with transaction.atomic():
+                # Без каскадов и сигналов Django удаляет одним DELETE, не загружая объекты
+                total += queryset.model.objects.filter(pk__in=pks).delete()[0]
+        return total
+
+    def clear_batched(self, queryset, **values):
+        if self.dry_run:
+            return queryset.count()
+        total = 0
+        for pks in self.batches(queryset):
+            with transaction.atomic():
+                total += queryset.model.objects.filter(pk__in=pks).update(**values)
+        return total
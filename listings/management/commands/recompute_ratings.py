@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from listings.models import User, Review
+from listings.response_cache import invalidate as invalidate_responses
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает агрегаты рейтинга пользователей (rating_count, rating_sum, гистограмма) по таблице Reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help="ID пользователя (можно несколько)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, users=None, batch_size=1000, **options):
+        fields = ['rating_count', 'rating_sum'] + User.RATING_HISTOGRAM_FIELDS
+
+        reviews = Review.objects.all()
+        if users:
+            reviews = reviews.filter(reviewed_id__in=users)
+        histograms = defaultdict(dict)
+        for reviewed_id, rating, count in reviews.values_list('reviewed_id', 'rating').annotate(n=Count('id')).order_by():
+            histograms[reviewed_id][rating] = count
+
+        targets = User.objects.order_by('pk')
+        if users:
+            targets = targets.filter(pk__in=users)
+
+        fixed = 0
+        batch = []
+        for user in targets.only('pk', *fields).iterator(chunk_size=batch_size):
+            histogram = histograms.get(user.pk, {})
+            expected = {f'rating_{star}': histogram.get(star, 0) for star in range(1, 6)}
+            expected['rating_count'] = sum(histogram.values())
+            expected['rating_sum'] = sum(star * count for star, count in histogram.items())
+            if all(getattr(user, field) == value for field, value in expected.items()):
+                continue
+            for field, value in expected.items():
+                setattr(user, field, value)
+            batch.append(user)
+            if len(batch) >= batch_size:
+                fixed += self._flush(batch, fields)
+
+        fixed += self._flush(batch, fields)
+        if fixed:
+            # bulk_update сигналов не шлет - рейтинг продавца входит в карточки выдачи
+            invalidate_responses('listings')
+        self.stdout.write(self.style.SUCCESS(f"Исправлено пользователей: {fixed}"))
+
+    @staticmethod
+    def _flush(batch, fields):
+        count = len(batch)
+        if batch:
+            with transaction.atomic():
+                User.objects.bulk_update(batch, fields)
+            batch.clear()
+        return count
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from listings.counters import reconcile_favorites_count
+
+
+class Command(BaseCommand):
+    help = "Сверяет Listing.favorites_count с таблицей Favorites и исправляет расхождения"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Размер диапазона id за один UPDATE")
+
+    def handle(self, *args, batch_size=5000, **options):
+        fixed = reconcile_favorites_count(batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Исправлено объявлений: {fixed}"))
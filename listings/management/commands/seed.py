@@ -0,0 +1,56 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from listings.seeding import DatasetSeeder, SeedConfig
+
+
+class Command(BaseCommand):
+    help = ("Генерирует большой детерминированный набор данных (пользователи, категории, объявления, "
+            "изображения, избранное, отзывы, сообщения) для нагрузочного тестирования")
+
+    def add_arguments(self, parser):
+        defaults = SeedConfig()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--listings', type=int, default=defaults.listings)
+        parser.add_argument('--category-depth', type=int, default=defaults.category_depth)
+        parser.add_argument('--category-fanout', type=int, default=defaults.category_fanout)
+        parser.add_argument('--images-per-listing', type=int, default=defaults.images_per_listing,
+                            help="Максимум изображений на объявление")
+        parser.add_argument('--favorites-per-user', type=int, default=defaults.favorites_per_user)
+        parser.add_argument('--reviews', type=int, default=defaults.reviews)
+        parser.add_argument('--threads', type=int, default=defaults.threads, help="Количество диалогов")
+        parser.add_argument('--messages-per-thread', type=int, default=defaults.messages_per_thread)
+        parser.add_argument('--days', type=int, default=defaults.days, help="Разброс created_at в днях")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--copy', action='store_true', help="Вставка через COPY (только PostgreSQL)")
+
+    def handle(self, *args, **options):
+        if options['category_depth'] < 1 or options['category_fanout'] < 1:
+            raise CommandError("Глубина и ветвление дерева категорий должны быть не меньше 1")
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError("--copy поддерживается только на PostgreSQL")
+
+        config = SeedConfig(
+            users=options['users'],
+            listings=options['listings'],
+            category_depth=options['category_depth'],
+            category_fanout=options['category_fanout'],
+            images_per_listing=options['images_per_listing'],
+            favorites_per_user=options['favorites_per_user'],
+            reviews=options['reviews'],
+            threads=options['threads'],
+            messages_per_thread=options['messages_per_thread'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            use_copy=options['copy'],
+        )
+
+        started = time.perf_counter()
+        summary = DatasetSeeder(config, stdout=self.stdout).run()
+        summary['seconds'] = round(time.perf_counter() - started, 1)
+        self.stdout.write(self.style.SUCCESS(json.dumps(summary, ensure_ascii=False)))
@@ -0,0 +1,365 @@
+"""Метрики в формате Prometheus с агрегацией между процессами через каталог снимков."""
+import atexit
+import glob
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.models import Count
+from django.http import HttpResponse
+
+from .throttling import client_ip
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MULTIPROC_DIR': '',
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': '',
+    # Без токена /metrics открыт только для INTERNAL_IPS; True - для всех (закрыт на уровне сети)
+    'PUBLIC': False,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UPLOAD_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONNECT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+def _labels_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.record(self, _labels_key(self.labelnames, labels), amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        self.registry.record(self, _labels_key(self.labelnames, labels), value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока; labels можно дополнить внутри блока (например, outcome)"""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Gauge(Metric):
+    """Значение вычисляется при сборе метрик функцией collect() -> {labels_tuple: value}"""
+
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help_text, collect, labelnames=()):
+        super().__init__(registry, name, help_text, labelnames)
+        self.collect = collect
+
+
+class MetricsRegistry:
+    """Значения копятся в памяти процесса под блокировкой - запись метрики это пара словарных операций.
+
+    При METRICS['MULTIPROC_DIR'] каждый процесс раз в FLUSH_INTERVAL секунд (в фоновом потоке)
+    атомарно переписывает свой снимок <pid>.json, а эндпоинт суммирует снимки всех процессов.
+    Снимки завершившихся воркеров остаются, поэтому счетчики не убывают; каталог очищается
+    при перезапуске всего сервиса.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._values = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._pid = None
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, collect, labelnames=()):
+        return self._register(Gauge(self, name, help_text, collect, labelnames))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def record(self, metric, labels, value):
+        with self._lock:
+            key = (metric.name, labels)
+            if metric.kind == 'counter':
+                self._values[key] = self._values.get(key, 0) + value
+            else:
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = [[0] * len(metric.buckets), 0.0, 0]
+                for index, bound in enumerate(metric.buckets):
+                    if value <= bound:
+                        state[0][index] += 1
+                        break
+                state[1] += value
+                state[2] += 1
+            self._dirty = True
+        self._ensure_flusher()
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    # Межпроцессная агрегация
+    def _directory(self):
+        return get_config()['MULTIPROC_DIR']
+
+    def _ensure_flusher(self):
+        if self._pid == os.getpid() or not self._directory():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # После fork значения родителя уже учтены в его снимке
+            if self._pid is not None:
+                self._values.clear()
+            self._pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        interval = get_config()['FLUSH_INTERVAL']
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            self._dirty = False
+            return json.dumps([[name, list(labels), value] for (name, labels), value in self._values.items()])
+
+    def flush(self):
+        directory = self._directory()
+        if not directory or not self._dirty:
+            return
+        os.makedirs(directory, exist_ok=True)
+        data = self.snapshot()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, os.path.join(directory, f'{os.getpid()}.json'))
+
+    def aggregate(self):
+        """Сумма значений по всем процессам: {(name, labels): value}"""
+        directory = self._directory()
+        if not directory:
+            with self._lock:
+                return {key: _copy_value(value) for key, value in self._values.items()}
+
+        self.flush()
+        totals = {}
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            try:
+                with open(path) as snapshot:
+                    entries = json.load(snapshot)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in entries:
+                key = (name, tuple(labels))
+                current = totals.get(key)
+                if current is None:
+                    totals[key] = _copy_value(value)
+                elif isinstance(value, list):
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+                else:
+                    totals[key] = current + value
+        return totals
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        values = self.aggregate()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            if metric.kind == 'gauge':
+                for labels, value in metric.collect().items():
+                    lines.append(f'{metric.name}{_format_labels(metric.labelnames, labels)} {_format_number(value)}')
+                continue
+            for (name, labels), value in sorted(values.items()):
+                if name != metric.name:
+                    continue
+                if metric.kind == 'counter':
+                    lines.append(f'{name}{_format_labels(metric.labelnames, labels)} {_format_number(value)}')
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket in zip(metric.buckets, counts):
+                    cumulative += bucket
+                    le = _format_labels(metric.labelnames + ('le',), labels + (_format_number(bound),))
+                    lines.append(f'{name}_bucket{le} {cumulative}')
+                le = _format_labels(metric.labelnames + ('le',), labels + ('+Inf',))
+                lines.append(f'{name}_bucket{le} {count}')
+                lines.append(f'{name}_sum{_format_labels(metric.labelnames, labels)} {_format_number(total)}')
+                lines.append(f'{name}_count{_format_labels(metric.labelnames, labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _copy_value(value):
+    return [list(value[0]), value[1], value[2]] if isinstance(value, list) else value
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _outbox_backlog():
+    from .models import PendingImage
+
+    # Один GROUP BY по индексу (status, id)
+    counts = dict(PendingImage.objects.exclude(status=PendingImage.STATUS_DONE)
+                  .values_list('status').annotate(n=Count('id')).order_by())
+    return {(status,): counts.get(status, 0) for status in (
+        PendingImage.STATUS_PENDING, PendingImage.STATUS_PROCESSING, PendingImage.STATUS_FAILED
+    )}
+
+
+REGISTRY = MetricsRegistry()
+atexit.register(REGISTRY.flush)
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'sellup_http_requests_total', 'HTTP-запросы по маршруту, методу и статусу', ('route', 'method', 'status'),
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    'sellup_http_request_duration_seconds', 'Длительность обработки запроса', ('route', 'method'),
+)
+DB_QUERIES = REGISTRY.histogram(
+    'sellup_db_queries_per_request', 'SQL-запросов на HTTP-запрос', ('route',), buckets=QUERY_COUNT_BUCKETS,
+)
+DB_DURATION = REGISTRY.histogram(
+    'sellup_db_duration_seconds', 'Суммарное время SQL на HTTP-запрос', ('route',),
+)
+DB_CONNECT_DURATION = REGISTRY.histogram(
+    'sellup_db_connect_duration_seconds', 'Установка соединения с БД (ожидание соединения запросом)', ('alias',),
+    buckets=CONNECT_BUCKETS,
+)
+DB_CONNECTIONS = REGISTRY.counter(
+    'sellup_db_connections_total', 'События соединений с БД: opened, reused, unusable, closed', ('alias', 'event'),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'sellup_cache_requests_total', 'Обращения к кешу: попадания и промахи', ('cache', 'result'),
+)
+COMPRESSED_BYTES = REGISTRY.counter(
+    'sellup_http_compression_bytes_total', 'Сжатие ответов: байт до (original) и после (sent), fresh - сжато '
+    'на лету, cached - готовый вариант из кеша ответов', ('encoding', 'source', 'stage'),
+)
+IMAGE_UPLOADS = REGISTRY.histogram(
+    'sellup_image_upload_duration_seconds', 'Загрузка изображений в imgBB', ('source', 'outcome'),
+    buckets=UPLOAD_BUCKETS,
+)
+OUTBOX_BACKLOG = REGISTRY.gauge(
+    'sellup_image_outbox_backlog', 'Очередь PendingImage по статусам', _outbox_backlog, ('status',),
+)
+
+
+def record_cache(cache_name, hit):
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+@contextmanager
+def observe_image_upload(source):
+    with IMAGE_UPLOADS.time(source=source, outcome='error') as labels:
+        yield
+        labels['outcome'] = 'ok'
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Латентность, статусы и SQL по имени маршрута (resolver_match.url_name)"""
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = _QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = (match.url_name or match.view_name) if match else 'unmatched'
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        HTTP_LATENCY.observe(elapsed, route=route, method=request.method)
+        DB_QUERIES.observe(counter.count, route=route)
+        DB_DURATION.observe(counter.duration, route=route)
+        return response
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus: по токену (Bearer), если он задан, иначе только с INTERNAL_IPS"""
+    config = get_config()
+    if config['TOKEN']:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {config['TOKEN']}"):
+            return HttpResponse(status=401)
+    elif not config['PUBLIC'] and client_ip(request) not in settings.INTERNAL_IPS:
+        return HttpResponse(status=403)
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
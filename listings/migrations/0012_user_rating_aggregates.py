@@ -0,0 +1,63 @@
+# Generated by Django 4.2.20 on 2026-10-19 06:19
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_ratings(apps, schema_editor):
+    User = apps.get_model('listings', 'User')
+    Review = apps.get_model('listings', 'Review')
+    totals = {}
+    for reviewed_id, rating, count in Review.objects.values_list('reviewed_id', 'rating').annotate(n=Count('id')).order_by():
+        user_totals = totals.setdefault(reviewed_id, {'rating_count': 0, 'rating_sum': 0})
+        user_totals['rating_count'] += count
+        user_totals['rating_sum'] += rating * count
+        user_totals[f'rating_{rating}'] = count
+    for user_id, values in totals.items():
+        User.objects.filter(pk=user_id).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_message_unread_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-19 06:21
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_favorites_count(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    Favorite = apps.get_model('listings', 'Favorite')
+    Listing.objects.update(favorites_count=Coalesce(
+        Subquery(
+            Favorite.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+            .annotate(n=Count('id')).values('n')
+        ),
+        Value(0),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_review_created_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_favorites_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.20 on 2026-10-19 06:36
+
+import hashlib
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def hash_existing_tokens(apps, schema_editor):
+    # Уже отправленные ссылки продолжают работать: при поиске хешируется токен из ссылки
+    User = apps.get_model('listings', 'User')
+    users = (User.objects.filter(Q(email_verification_token__isnull=False) | Q(password_reset_token__isnull=False))
+             .only('pk', 'email_verification_token', 'password_reset_token'))
+    for user in users.iterator(chunk_size=1000):
+        for field in ('email_verification_token', 'password_reset_token'):
+            value = getattr(user, field)
+            if value:
+                setattr(user, field, hashlib.sha256(value.encode()).hexdigest())
+        user.save(update_fields=['email_verification_token', 'password_reset_token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0015_pendingimage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='email_verification_token',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='password_reset_token',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        # Обратно не восстановить - после отката выданные токены станут недействительны
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.20 on 2026-10-19 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0017_pendingimage_lease'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_reviewed_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_reviewer_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewed', '-created_at', '-id'], name='review_reviewed_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewer', '-created_at', '-id'], name='review_reviewer_created_idx'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager, User
 import random
@@ -57,26 +57,48 @@ class User(AbstractBaseUser, PermissionsMixin):
     role = models.ForeignKey('Role', on_delete=models.CASCADE)
 
     email_verified = models.BooleanField(default=False)
-    email_verification_token = models.CharField(max_length=100, null=True, blank=True)
+    # SHA-256 от выданных токенов (см. tokens.py), поиск идет по индексу
+    email_verification_token = models.CharField(max_length=100, null=True, blank=True, db_index=True)
     email_verification_sent_at = models.DateTimeField(null=True, blank=True)
 
-    password_reset_token = models.CharField(max_length=255, null=True, blank=True)
+    password_reset_token = models.CharField(max_length=255, null=True, blank=True, db_index=True)
     password_reset_token_created = models.DateTimeField(null=True, blank=True)
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
 
+    # Агрегаты полученных отзывов, поддерживаются сигналами Review (см. signals.py)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    RATING_HISTOGRAM_FIELDS = ['rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
     class Meta:
         db_table = 'Users'
 
     def __str__(self):
         return self.username or self.email
 
+    @property
+    def rating_average(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+    @property
+    def rating_histogram(self):
+        return {str(star): getattr(self, f'rating_{star}') for star in range(1, 6)}
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -137,6 +159,8 @@ class Listing(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     attributes = models.JSONField(default=dict)
+    # Денормализованный счетчик избранного, см. counters.py и reconcile_favorites_count
+    favorites_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         db_table = 'Listings'
@@ -162,6 +186,38 @@ class Image(models.Model):
         return f"Image for {self.listing.title}"
 
 
+# Очередь внешних изображений на перезаливку в imgBB (массовый импорт объявлений)
+class PendingImage(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUSES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    listing = models.ForeignKey(Listing, related_name='pending_images', on_delete=models.CASCADE)
+    source_url = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Срок захвата воркером: после него элемент в статусе processing снова доступен другим
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'PendingImages'
+        indexes = [
+            models.Index(fields=['status', 'id'], name='pending_image_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pending image for listing {self.listing_id}: {self.source_url}"
+
+
 # Модель для избранных
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -185,10 +241,24 @@ class Review(models.Model):
 
     class Meta:
         db_table = 'Reviews'
+        indexes = [
+            # Порядок ленты ReviewCursorPagination: created_at не уникален, id - второй ключ
+            models.Index(fields=['reviewed', '-created_at', '-id'], name='review_reviewed_created_idx'),
+            models.Index(fields=['reviewer', '-created_at', '-id'], name='review_reviewer_created_idx'),
+        ]
 
     def __str__(self):
         return f"Review from {self.reviewer.username} to {self.reviewed.username}"
 
+    # Сохранение и удаление атомарны вместе с пересчетом агрегатов рейтинга в сигналах
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            return super().delete(*args, **kwargs)
+
 
 class ListingCategory(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
@@ -225,6 +295,12 @@ class Message(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Частичный индекс только по непрочитанным: счетчик и mark_read не сканируют историю переписки
+            models.Index(fields=['receiver', 'sender'], condition=models.Q(is_read=False), name='message_unread_idx'),
+        ]
+
 class PasswordResetToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     token = models.CharField(max_length=64, unique=True)
@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+
+
+# Курсорная пагинация отзывов: позиция по (created_at, id), индекс (reviewed, created_at, id) /
+# (reviewer, created_at, id). Без id отзывы с одинаковым created_at (массовая загрузка, сидинг)
+# пропускались бы или повторялись на границе страниц
+class ReviewCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,244 @@
+"""Быстрый путь чтения списков: словари из values() вместо экземпляров моделей и ModelSerializer.
+
+Вывод совпадает с ListingSerializer, FavoriteSerializer, FavoriteCardSerializer, ReviewSerializer
+и MessageSerializer поле в поле: даты и цены форматируются теми же полями DRF. Поля связей
+по внешнему ключу входят в основной запрос, списки (изображения, категории, фильтры) грузятся
+пачкой - по одному запросу на связь, теми же запросами, что и prefetch_related медленного пути.
+Совпадение проверяет ProjectionContractTests: поле, добавленное в сериализатор, нужно добавить
+и сюда. API_PROJECTIONS=False возвращает сериализаторы.
+"""
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import FilterAttribute, Image, Listing, ListingCategory, User
+
+_price_field = Listing._meta.get_field('price')
+_datetime = serializers.DateTimeField().to_representation
+_price = serializers.DecimalField(
+    max_digits=_price_field.max_digits, decimal_places=_price_field.decimal_places
+).to_representation
+
+USER_FIELDS = (
+    'id', 'username', 'email', 'phone_number', 'email_verified', 'is_active', 'role_id', 'role__name',
+    'rating_count', 'rating_sum', *User.RATING_HISTOGRAM_FIELDS,
+)
+LISTING_FIELDS = (
+    'id', 'title', 'description', 'price', 'address', 'created_at', 'attributes', 'favorites_count',
+    'category_id', 'category__name', 'category__parent_id', 'user_id',
+    *(f'user__{field}' for field in USER_FIELDS[1:]),
+)
+REVIEW_FIELDS = ('id', 'reviewer_id', 'reviewer__username', 'reviewed_id', 'rating', 'comment', 'created_at')
+MESSAGE_FIELDS = ('id', 'sender_id', 'receiver_id', 'content', 'created_at', 'is_read')
+FILTER_FIELDS = ('id', 'name', 'attribute_type', 'options', 'min_value', 'max_value', 'unit')
+
+
+def projections_enabled():
+    return getattr(settings, 'API_PROJECTIONS', True)
+
+
+def _values(queryset, fields):
+    # select_related/prefetch_related общих get_queryset() здесь не нужны:
+    # связи по внешнему ключу входят в values(), списки грузятся отдельно
+    return queryset.select_related(None).prefetch_related(None).values(*fields)
+
+
+def _datetime_or_none(value):
+    return None if value is None else _datetime(value)
+
+
+def _float_or_none(value):
+    return None if value is None else float(value)
+
+
+def _strip(rows, prefix):
+    """Строки values() связанной модели (listing__title -> title)"""
+    offset = len(prefix)
+    return [{key[offset:]: value for key, value in row.items() if key.startswith(prefix)} for row in rows]
+
+
+def _rating_average(count, total):
+    # Как User.rating_average
+    return float(round(total / count, 2)) if count else None
+
+
+def _category(category_id, name, parent_id):
+    return {'id': category_id, 'name': name, 'parent': parent_id}
+
+
+def _profile(row):
+    """UserProfileSerializer по строке объявления (поля user__*)"""
+    count = row['user__rating_count']
+    return {
+        'id': row['user_id'],
+        'username': row['user__username'],
+        'email': row['user__email'],
+        'email_address': row['user__email'],
+        'phone_number': row['user__phone_number'],
+        'role': {'id': row['user__role_id'], 'name': row['user__role__name']},
+        'email_verified': row['user__email_verified'],
+        'is_active': row['user__is_active'],
+        'rating': {
+            'average': _rating_average(count, row['user__rating_sum']),
+            'count': count,
+            'histogram': {str(star): row[f'user__rating_{star}'] for star in range(1, 6)},
+        },
+    }
+
+
+def _images_by_listing(listing_ids):
+    images = {}
+    for row in Image.objects.filter(listing_id__in=listing_ids).values('listing_id', 'id', 'url'):
+        images.setdefault(row['listing_id'], []).append({'id': row['id'], 'url': row['url']})
+    return images
+
+
+def _categories_by_listing(listing_ids):
+    links = {}
+    rows = ListingCategory.objects.filter(listing_id__in=listing_ids).values(
+        'listing_id', 'id', 'category_id', 'category__name', 'category__parent_id'
+    )
+    for row in rows:
+        links.setdefault(row['listing_id'], []).append({
+            'id': row['id'],
+            'category': _category(row['category_id'], row['category__name'], row['category__parent_id']),
+        })
+    return links
+
+
+def _filters_by_category(category_ids):
+    filters = {}
+    for row in FilterAttribute.objects.filter(category_id__in=category_ids).values('category_id', *FILTER_FIELDS):
+        filters.setdefault(row['category_id'], []).append({
+            'id': row['id'],
+            'name': row['name'],
+            'attribute_type': row['attribute_type'],
+            'options': row['options'],
+            'min_value': _float_or_none(row['min_value']),
+            'max_value': _float_or_none(row['max_value']),
+            'unit': row['unit'],
+        })
+    return filters
+
+
+def listing_values(queryset):
+    return _values(queryset, LISTING_FIELDS)
+
+
+def project_listings(rows):
+    """ListingSerializer(many=True) по строкам listing_values(): 4 запроса на любой объем"""
+    rows = list(rows)
+    if not rows:
+        return []
+    listing_ids = [row['id'] for row in rows]
+    images = _images_by_listing(listing_ids)
+    links = _categories_by_listing(listing_ids)
+    filters = _filters_by_category({row['category_id'] for row in rows})
+
+    profiles = {}
+    result = []
+    for row in rows:
+        profile = profiles.get(row['user_id'])
+        if profile is None:
+            profile = profiles[row['user_id']] = _profile(row)
+        result.append({
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'price': _price(row['price']),
+            'address': row['address'],
+            'created_at': _datetime_or_none(row['created_at']),
+            'user': profile,
+            'images': images.get(row['id'], []),
+            'categories': links.get(row['id'], []),
+            'category': _category(row['category_id'], row['category__name'], row['category__parent_id']),
+            'attributes': row['attributes'],
+            'filters': filters.get(row['category_id'], []),
+            'favorites_count': row['favorites_count'],
+        })
+    return result
+
+
+def favorite_values(queryset):
+    return _values(queryset, ('id', *(f'listing__{field}' for field in LISTING_FIELDS)))
+
+
+def project_favorites(rows):
+    """FavoriteSerializer(many=True) по строкам favorite_values()"""
+    rows = list(rows)
+    listings = project_listings(_strip(rows, 'listing__'))
+    return [{'id': row['id'], 'listing': listing} for row, listing in zip(rows, listings)]
+
+
+CARD_FIELDS = (
+    'id', 'listing_id', 'listing__title', 'listing__price', 'listing__address', 'listing__created_at',
+    'listing__favorites_count', 'listing__category_id', 'listing__category__name', 'listing__category__parent_id',
+    'listing__user_id', 'listing__user__username', 'listing__user__rating_count', 'listing__user__rating_sum',
+)
+
+
+def favorite_card_values(queryset):
+    return _values(queryset, CARD_FIELDS)
+
+
+def project_favorite_cards(rows):
+    """FavoriteCardSerializer(many=True) по строкам favorite_card_values(): 2 запроса"""
+    rows = list(rows)
+    images = _images_by_listing([row['listing_id'] for row in rows]) if rows else {}
+    result = []
+    for row in rows:
+        listing_images = images.get(row['listing_id'])
+        count = row['listing__user__rating_count']
+        result.append({
+            'id': row['id'],
+            'listing': {
+                'id': row['listing_id'],
+                'title': row['listing__title'],
+                'price': _price(row['listing__price']),
+                'address': row['listing__address'],
+                'created_at': _datetime_or_none(row['listing__created_at']),
+                'category': _category(
+                    row['listing__category_id'], row['listing__category__name'], row['listing__category__parent_id']
+                ),
+                'user': {
+                    'id': row['listing__user_id'],
+                    'username': row['listing__user__username'],
+                    'rating': _rating_average(count, row['listing__user__rating_sum']),
+                    'rating_count': count,
+                },
+                'image': listing_images[0]['url'] if listing_images else None,
+                'favorites_count': row['listing__favorites_count'],
+            },
+        })
+    return result
+
+
+def review_values(queryset):
+    return _values(queryset, REVIEW_FIELDS)
+
+
+def project_reviews(rows):
+    """ReviewSerializer(many=True) по строкам review_values(); подходит и для страницы CursorPagination"""
+    return [{
+        'id': row['id'],
+        'reviewer': {'id': row['reviewer_id'], 'username': row['reviewer__username']},
+        'reviewed': row['reviewed_id'],
+        'rating': row['rating'],
+        'comment': row['comment'],
+        'created_at': _datetime_or_none(row['created_at']),
+    } for row in rows]
+
+
+def message_values(queryset):
+    return _values(queryset, MESSAGE_FIELDS)
+
+
+def project_messages(rows):
+    """MessageSerializer(many=True) по строкам message_values()"""
+    return [{
+        'id': row['id'],
+        'sender': row['sender_id'],
+        'receiver': row['receiver_id'],
+        'content': row['content'],
+        'created_at': _datetime_or_none(row['created_at']),
+        'is_read': row['is_read'],
+    } for row in rows]
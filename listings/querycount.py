@@ -0,0 +1,143 @@
+"""Подсчет SQL-запросов на HTTP-запрос: бюджеты эндпоинтов и поиск N+1."""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'HEADERS': False,
+    'N_PLUS_ONE_THRESHOLD': 5,
+}
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN \((?:\s*(?:\?|%s)\s*,?)+\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_COUNT', {})}
+
+
+def query_shape(sql):
+    """Нормализует SQL до "формы": литералы и списки IN заменяются плейсхолдерами"""
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+class QueryCollector:
+    """execute_wrapper, который считает запросы, время в БД и повторы одинаковых форм"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def duplicates(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+@contextmanager
+def collect_queries():
+    collector = QueryCollector()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(collector))
+        yield collector
+
+
+def get_query_budget(view_func, method):
+    """Бюджет запросов, объявленный на представлении атрибутом query_budget.
+
+    Значение - число или словарь {action: число} для ViewSet'ов.
+    """
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    budget = getattr(view_class or view_func, 'query_budget', None)
+    if isinstance(budget, dict):
+        action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+        return budget.get(action)
+    return budget
+
+
+class QueryCountMiddleware:
+    """Опциональный middleware: число запросов и время в БД на запрос, предупреждения о N+1.
+
+    Включается настройкой QUERY_COUNT['ENABLED'], заголовки X-Query-* - QUERY_COUNT['HEADERS'].
+    """
+
+    def __init__(self, get_response):
+        self.config = get_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect_queries() as collector:
+            response = self.get_response(request)
+
+        duplicates = collector.duplicates(self.config['N_PLUS_ONE_THRESHOLD'])
+        budget = getattr(request, '_query_budget', None)
+        over_budget = budget is not None and collector.count > budget
+
+        if duplicates:
+            logger.warning(
+                "Возможный N+1 на %s %s: %s", request.method, request.path,
+                "; ".join(f"{count}x {shape[:200]}" for shape, count in duplicates),
+            )
+        if over_budget:
+            logger.warning(
+                "Превышен бюджет запросов на %s %s: %d > %d", request.method, request.path, collector.count, budget
+            )
+
+        if self.config['HEADERS']:
+            response['X-Query-Count'] = str(collector.count)
+            response['X-Query-Time-Ms'] = f"{collector.duration * 1000:.1f}"
+            response['X-Query-Duplicates'] = str(len(duplicates))
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = get_query_budget(view_func, request.method)
+
+
+class QueryBudgetTestMixin:
+    """Примесь для TestCase: проверка бюджета запросов эндпоинта и отсутствия N+1"""
+
+    n_plus_one_threshold = DEFAULTS['N_PLUS_ONE_THRESHOLD']
+
+    def assertWithinQueryBudget(self, method, path, *args, **kwargs):
+        match = resolve(path.split('?')[0])
+        budget = get_query_budget(match.func, method)
+        self.assertIsNotNone(budget, f"Для {method} {path} не объявлен query_budget")
+
+        with collect_queries() as collector:
+            response = getattr(self.client, method.lower())(path, *args, **kwargs)
+
+        self.assertLess(response.status_code, 400, f"{method} {path} вернул {response.status_code}")
+        duplicates = collector.duplicates(self.n_plus_one_threshold)
+        self.assertFalse(duplicates, f"N+1 на {method} {path}: {duplicates}")
+        self.assertLessEqual(
+            collector.count, budget, f"{method} {path}: {collector.count} запросов при бюджете {budget}"
+        )
+        return response
@@ -0,0 +1,270 @@
+"""Доставка сообщений в реальном времени через WebSocket (ASGI)."""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+DEFAULT_CHANNEL_LAYER = {
+    'BACKEND': 'listings.realtime.InMemoryChannelLayer',
+    'OPTIONS': {},
+}
+
+
+def user_group(user_id):
+    return f"user.{user_id}"
+
+
+class BaseChannelLayer:
+    """Интерфейс канального слоя: подписка на группы и публикация событий.
+
+    ``publish`` вызывается из синхронного кода (представления, сигналы) в любом потоке,
+    ``subscribe``/``unsubscribe`` - из event loop ASGI-сервера.
+    """
+
+    async def subscribe(self, group):
+        raise NotImplementedError
+
+    async def unsubscribe(self, group, queue):
+        raise NotImplementedError
+
+    def publish(self, group, event):
+        raise NotImplementedError
+
+
+class InMemoryChannelLayer(BaseChannelLayer):
+    """Канальный слой внутри одного процесса (разработка, тесты, один узел)"""
+
+    def __init__(self, capacity=100, **options):
+        self.capacity = capacity
+        self._groups = defaultdict(set)
+        self._lock = threading.Lock()
+
+    async def subscribe(self, group):
+        queue = asyncio.Queue(maxsize=self.capacity)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._groups[group].add((loop, queue))
+        return queue
+
+    async def unsubscribe(self, group, queue):
+        with self._lock:
+            subscribers = self._groups.get(group)
+            if not subscribers:
+                return
+            subscribers.difference_update({item for item in subscribers if item[1] is queue})
+            if not subscribers:
+                del self._groups[group]
+
+    def publish(self, group, event):
+        with self._lock:
+            subscribers = list(self._groups.get(group, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # Event loop уже закрыт - подписчик отвалился без unsubscribe
+                continue
+
+    @staticmethod
+    def _deliver(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Очередь WebSocket-подписчика переполнена, событие %s отброшено", event.get('type'))
+
+
+class RedisChannelLayer(InMemoryChannelLayer):
+    """Канальный слой для нескольких узлов поверх Redis pub/sub.
+
+    Публикация уходит в Redis, а каждый процесс держит одну подписку на все группы
+    и раздает события своим локальным подписчикам.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='sellup', **options):
+        super().__init__(**options)
+        import redis  # опциональная зависимость, нужна только этому бэкенду
+
+        self.url = url
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._listeners = {}
+
+    async def subscribe(self, group):
+        queue = await super().subscribe(group)
+        loop = asyncio.get_running_loop()
+        if loop not in self._listeners:
+            self._listeners[loop] = loop.create_task(self._listen())
+        return queue
+
+    def publish(self, group, event):
+        self._redis.publish(f"{self.prefix}:{group}", json.dumps(event, default=str))
+
+    async def _listen(self):
+        """Подписка на все группы; при обрыве соединения с Redis переподключается с нарастающей паузой.
+
+        События, опубликованные во время обрыва, теряются - клиенты досинхронизируются через REST.
+        """
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            subscribed = []
+            try:
+                await self._listen_once(subscribed)
+            except Exception:
+                logger.warning("Подписка на Redis %s оборвалась", self.url, exc_info=True)
+            # После успешной подписки пауза снова минимальная
+            delay = RECONNECT_MIN_DELAY if subscribed else min(delay * 2, RECONNECT_MAX_DELAY)
+            await asyncio.sleep(delay)
+
+    async def _listen_once(self, subscribed):
+        import redis.asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(f"{self.prefix}:*")
+            subscribed.append(True)
+            offset = len(self.prefix) + 1
+            async for item in pubsub.listen():
+                if item['type'] != 'pmessage':
+                    continue
+                group = item['channel'].decode()[offset:]
+                super().publish(group, json.loads(item['data']))
+        finally:
+            await pubsub.close()
+            await client.close()
+
+
+_channel_layer = None
+_channel_layer_lock = threading.Lock()
+
+
+def get_channel_layer():
+    global _channel_layer
+    if _channel_layer is None:
+        with _channel_layer_lock:
+            if _channel_layer is None:
+                config = getattr(settings, 'MESSAGE_CHANNEL_LAYER', DEFAULT_CHANNEL_LAYER)
+                backend = import_string(config['BACKEND'])
+                _channel_layer = backend(**config.get('OPTIONS', {}))
+    return _channel_layer
+
+
+def reset_channel_layer():
+    """Сброс синглтона (используется в тестах при смене настроек)"""
+    global _channel_layer
+    _channel_layer = None
+
+
+def publish_new_message(message):
+    from .serializers import MessageSerializer
+
+    get_channel_layer().publish(user_group(message.receiver_id), {
+        'type': 'message.new',
+        'message': MessageSerializer(message).data,
+    })
+
+
+def publish_read_receipt(reader_id, sender_id, message_ids=None, up_to=None):
+    """Уведомляет отправителя о том, что собеседник прочитал его сообщения"""
+    get_channel_layer().publish(user_group(sender_id), {
+        'type': 'message.read',
+        'reader': reader_id,
+        'message_ids': message_ids,
+        'up_to': up_to,
+    })
+
+
+def _socket_token(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0]
+
+    headers = dict(scope.get('headers', []))
+    auth = headers.get(b'authorization', b'').decode().split()
+    if len(auth) == 2 and auth[0].lower() == 'token':
+        return auth[1]
+    return None
+
+
+def _resolve_token(key):
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+async def authenticate_socket(scope):
+    key = _socket_token(scope)
+    if not key:
+        return None
+    return await sync_to_async(_resolve_token)(key)
+
+
+class MessageSocket:
+    """WebSocket со входящими сообщениями и отметками о прочтении для текущего пользователя"""
+
+    async def __call__(self, scope, receive, send):
+        event = await receive()
+        if event['type'] != 'websocket.connect':
+            return
+
+        user = await authenticate_socket(scope)
+        if user is None:
+            await send({'type': 'websocket.close', 'code': 4401})
+            return
+
+        await send({'type': 'websocket.accept'})
+
+        layer = get_channel_layer()
+        group = user_group(user.id)
+        queue = await layer.subscribe(group)
+        incoming = asyncio.ensure_future(receive())
+        outgoing = asyncio.ensure_future(queue.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait({incoming, outgoing}, return_when=asyncio.FIRST_COMPLETED)
+
+                if outgoing in done:
+                    await send({'type': 'websocket.send', 'text': json.dumps(outgoing.result(), default=str)})
+                    outgoing = asyncio.ensure_future(queue.get())
+
+                if incoming in done:
+                    message = incoming.result()
+                    if message['type'] == 'websocket.disconnect':
+                        break
+                    if message.get('text') == 'ping':
+                        await send({'type': 'websocket.send', 'text': 'pong'})
+                    incoming = asyncio.ensure_future(receive())
+        finally:
+            incoming.cancel()
+            outgoing.cancel()
+            await layer.unsubscribe(group, queue)
+
+
+WEBSOCKET_ROUTES = {
+    '/ws/messages/': MessageSocket(),
+}
+
+
+async def websocket_application(scope, receive, send):
+    handler = WEBSOCKET_ROUTES.get(scope['path'])
+    if handler is None:
+        await receive()
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    await handler(scope, receive, send)
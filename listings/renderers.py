@@ -0,0 +1,109 @@
+"""JSON для API через orjson с откатом на стандартный json (настройка API_FAST_JSON).
+
+Вывод побайтно совпадает с rest_framework.renderers.JSONRenderer при настройках DRF
+по умолчанию (UNICODE_JSON, COMPACT_JSON): datetime кодируется orjson нативно (UTC как 'Z'),
+Decimal и прочие типы DRF - через encoders.JSONEncoder.default. Что orjson записал бы
+иначе или не смог бы записать (float с экспонентой, NaN и бесконечности, целые больше
+64 бит), рендерится родительским классом - с тем же результатом или той же ошибкой.
+"""
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders, json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson указан в requirements.txt
+    orjson = None
+
+ORJSON_OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+_drf_default = encoders.JSONEncoder().default
+
+# orjson читает целые больше 64 бит как float с потерей точности - такие тела разбирает json
+# (проверка: цифры -> '0', остальное -> ' ', затем поиск 19 нулей подряд; в разы быстрее regex)
+_DIGITS_ONLY = bytes(ord('0') if chr(code).isdigit() and code < 128 else ord(' ') for code in range(256))
+_LONG_NUMBER = b'0' * 19
+
+
+_SCALARS = frozenset((str, int, bool, type(None)))
+_CONTAINERS = (dict, list, tuple)
+
+
+def _plain_float(value):
+    # В диапазоне [1e-4, 1e16) и для нуля кратчайшая запись у orjson и json совпадает
+    return not value or 1e-4 <= abs(value) < 1e16
+
+
+def _floats_match_json(data):
+    """False, если в данных есть float, который orjson запишет не как json: с экспонентой
+    (1e16 вместо 1e+16, 0.00001 вместо 1e-05), NaN или бесконечность (null вместо ошибки)"""
+    # Обход на каждом ответе: проверки типов по identity, без вызовов функций на элемент
+    stack = [(data,)]
+    pop, push = stack.pop, stack.append
+    while stack:
+        value = pop()
+        for item in (value.values() if isinstance(value, dict) else value):
+            kind = type(item)
+            if kind in _SCALARS:
+                continue
+            if kind is float:
+                if item and not 1e-4 <= abs(item) < 1e16:
+                    return False
+            elif kind is dict or kind is list or isinstance(item, _CONTAINERS):
+                push(item)
+    return True
+
+
+def _default(value):
+    result = _drf_default(value)
+    # Например, Decimal при COERCE_DECIMAL_TO_STRING=False; ошибка отправляет рендеринг в json
+    if type(result) is float and not _plain_float(result):
+        raise TypeError("float вне диапазона записи orjson")
+    return result
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer на orjson; форматированный вывод (indent, Browsable API) и нестандартные
+    настройки DRF идут через родительский класс"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if not _floats_match_json(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Целые больше 64 бит, неподдерживаемые типы: результат или ошибка - как у DRF
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и DRF, экранируем U+2028/U+2029, чтобы JSON оставался подмножеством JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(parsers.JSONParser):
+    """JSONParser на orjson (только UTF-8); ошибки и редкие случаи (целые больше 64 бит)
+    разбираются стандартным json, чтобы сообщения и результат не отличались"""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if _LONG_NUMBER not in body.translate(_DIGITS_ONLY):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        try:
+            parse_constant = json.strict_constant if self.strict else None
+            return json.loads(body.decode(encoding), parse_constant=parse_constant)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
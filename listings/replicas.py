@@ -0,0 +1,156 @@
+"""Чтение с реплик БД и закрепление клиента за основной БД после записи (read-your-writes)."""
+import contextvars
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULTS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': 5,
+    'COOKIE_NAME': 'db_primary',
+    'CACHE_ALIAS': 'default',
+}
+
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+_force_primary = contextvars.ContextVar('replica_force_primary', default=False)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'READ_REPLICAS', {})}
+
+
+@contextmanager
+def pin_primary():
+    """Все чтения внутри блока идут в основную БД"""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def _marker_key(request):
+    # Клиент определяется по учетным данным (токен или сессия); в ключ попадает только хеш
+    credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'db:primary:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+class _RequestState:
+    def __init__(self, request, config):
+        self.request = request
+        self.config = config
+        self.view_primary = False
+        self.wrote = False
+        self._pinned = None
+
+    def pinned(self):
+        # Проверяется лениво - при первом чтении, а не на каждом запросе
+        if self._pinned is None:
+            self._pinned = self._cookie_pinned() or self._marker_pinned()
+        return self._pinned
+
+    def _cookie_pinned(self):
+        try:
+            return float(self.request.COOKIES.get(self.config['COOKIE_NAME'], 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _marker_pinned(self):
+        key = _marker_key(self.request)
+        return key is not None and caches[self.config['CACHE_ALIAS']].get(key) is not None
+
+    def use_primary(self):
+        return self.wrote or self.view_primary or self.pinned()
+
+
+def primary_required():
+    if _force_primary.get():
+        return True
+    state = _request_state.get()
+    if state is not None and state.use_primary():
+        return True
+    # В транзакции читаем то же, во что пишем
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class ReplicaRouter:
+    """Чтения - на случайную реплику из READ_REPLICAS['ALIASES'], записи и миграции - в default.
+
+    Чтения остаются в основной БД внутри транзакции, в блоке pin_primary(), в представлениях
+    с use_primary, после записи в текущем запросе и STICKY_SECONDS секунд после записи
+    тем же клиентом (см. ReplicaMiddleware). Без реплик все идет в default.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_config()['ALIASES']
+        if not replicas or primary_required():
+            return DEFAULT_DB_ALIAS
+        # Связанные объекты читаем оттуда же, откуда загружен экземпляр
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def view_uses_primary(view_func, method):
+    """Атрибут представления use_primary: bool или словарь {action: bool} для ViewSet'ов"""
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    use_primary = getattr(view_class or view_func, 'use_primary', False)
+    if isinstance(use_primary, dict):
+        action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+        return bool(use_primary.get(action))
+    return bool(use_primary)
+
+
+class ReplicaMiddleware:
+    """Закрепляет клиента за основной БД после записи: cookie (браузеры) и маркер в кеше
+    по учетным данным (API-клиенты с токеном, которые не хранят cookie)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if not config['ALIASES']:
+            return self.get_response(request)
+
+        state = _RequestState(request, config)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        sticky_seconds = config['STICKY_SECONDS']
+        if state.wrote and sticky_seconds > 0:
+            response.set_cookie(config['COOKIE_NAME'], str(int(time.time() + sticky_seconds)),
+                                max_age=sticky_seconds, httponly=True, samesite='Lax')
+            key = _marker_key(request)
+            if key is not None:
+                caches[config['CACHE_ALIAS']].set(key, 1, sticky_seconds)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request_state.get()
+        if state is not None:
+            state.view_primary = view_uses_primary(view_func, request.method)
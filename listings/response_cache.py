@@ -0,0 +1,140 @@
+"""Кеш готовых ответов анонимного чтения: дерево категорий и выдача объявлений.
+
+В кеше хранится отрендеренное тело вместе со сжатыми вариантами (compression.precompress),
+поэтому повторное попадание не сериализует и не сжимает одни и те же байты заново.
+Инвалидация - по версии группы: сигналы моделей (signals.py) выпускают новую версию,
+старые записи перестают читаться и истекают по TTL. Пути без сигналов (bulk_create импорта,
+сброс счетчика favorites_count, команды сверки) вызывают invalidate() сами.
+
+Версии хранятся в том же кеше, поэтому мгновенная инвалидация работает только с общим
+кешем (Redis, memcached). В кеше памяти процесса (locmem) новая версия видна лишь воркеру,
+который ее выпустил; остальные отдают свои записи до истечения, поэтому там записи живут
+не дольше LOCAL_TTL - это и есть гарантия свежести для такого кеша.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from .checks import is_process_local_cache
+from .compression import precompress
+from .metrics import record_cache
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TTL': 60,
+    # Потолок TTL для кеша в памяти процесса: сброс из другого воркера сюда не доходит
+    'LOCAL_TTL': 5,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+
+
+def _cache():
+    return caches[get_config()['CACHE_ALIAS']]
+
+
+def _version_key(group):
+    return f'respcache:version:{group}'
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_version(group):
+    cache = _cache()
+    version = cache.get(_version_key(group))
+    if version is None:
+        version = _new_version()
+        # Параллельный запрос мог записать версию раньше - тогда берем его
+        if not cache.add(_version_key(group), version, None):
+            version = cache.get(_version_key(group), version)
+    return version
+
+
+def invalidate(*groups):
+    """Новая версия групп: все закешированные ответы этих групп перестают читаться"""
+    _cache().set_many({_version_key(group): _new_version() for group in groups}, None)
+
+
+def cacheable_request(request):
+    """Только анонимные GET/HEAD (без токена и сессии) с JSON-ответом"""
+    return (
+        request.method in ('GET', 'HEAD')
+        and 'HTTP_AUTHORIZATION' not in request.META
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and getattr(request, 'accepted_renderer', None) is not None
+        and request.accepted_renderer.format == 'json'
+    )
+
+
+def response_cache_key(group, request):
+    variant = f'{request.get_full_path()}\n{request.accepted_media_type}'
+    return f'respcache:{group}:{get_version(group)}:{hashlib.sha256(variant.encode()).hexdigest()}'
+
+
+def entry_ttl():
+    config = get_config()
+    if is_process_local_cache(config['CACHE_ALIAS']):
+        return min(config['TTL'], config['LOCAL_TTL'])
+    return config['TTL']
+
+
+def store(key, response):
+    body = response.content
+    entry = {'content': body, 'content_type': response['Content-Type'], 'precompressed': precompress(body)}
+    _cache().set(key, entry, entry_ttl())
+
+
+def cached_response(entry):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    # Готовые варианты для CompressionMiddleware
+    response.precompressed = entry['precompressed']
+    return response
+
+
+class CachedResponseMixin:
+    """Кеширует ответы действий ViewSet'а, объявленных атрибутом response_cache.
+
+    response_cache - группа инвалидации или словарь {action: группа}. Лимиты, права и
+    согласование формата проверяются как обычно (initial), из кеша подменяется только
+    обработчик действия.
+    """
+
+    response_cache = None
+
+    def get_response_cache_group(self):
+        group = self.response_cache
+        if isinstance(group, dict):
+            return group.get(getattr(self, 'action', None))
+        return group
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._response_cache_key = None
+        group = self.get_response_cache_group()
+        if not group or not get_config()['ENABLED'] or not cacheable_request(request):
+            return
+
+        key = response_cache_key(group, request)
+        entry = _cache().get(key)
+        record_cache('response', entry is not None)
+        if entry is None:
+            self._response_cache_key = key
+        else:
+            # dispatch() берет обработчик после initial()
+            setattr(self, request.method.lower(), lambda *args, **kwargs: cached_response(entry))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_response_cache_key', None)
+        if key is not None and isinstance(response, Response) and response.status_code == 200:
+            response.add_post_render_callback(lambda rendered: store(key, rendered))
+        return response
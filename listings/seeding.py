@@ -0,0 +1,332 @@
+"""Детерминированная генерация тестовых данных (бенчмарки, нагрузочное тестирование)."""
+import bisect
+import json
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection, transaction
+
+from .models import Role, User, Category, FilterAttribute, Listing, Image, Favorite, Review, Message
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', 'Самара', 'Краснодар', 'Пермь']
+WORDS = ['продам', 'новый', 'б/у', 'отличный', 'срочно', 'торг', 'оригинал', 'гарантия', 'доставка', 'комплект']
+COLORS = ['черный', 'белый', 'серый', 'красный', 'синий', 'зеленый']
+CONDITIONS = ['новое', 'как новое', 'хорошее', 'удовлетворительное']
+
+# Фиксированная точка отсчета, чтобы одинаковый seed давал одинаковые created_at
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+@dataclass
+class SeedConfig:
+    users: int = 200
+    listings: int = 2000
+    category_depth: int = 3
+    category_fanout: int = 4
+    images_per_listing: int = 3
+    favorites_per_user: int = 10
+    reviews: int = 1000
+    threads: int = 300
+    messages_per_thread: int = 6
+    days: int = 365
+    batch_size: int = 1000
+    seed: int = 42
+    use_copy: bool = False
+
+
+class IdPool:
+    """Множество id в виде отрезков: память не растет, пока id идут подряд"""
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._offsets = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for start, end in zip(self._starts, self._ends):
+            yield from range(start, end + 1)
+
+    def extend(self, ids):
+        for pk in ids:
+            if self._ends and pk == self._ends[-1] + 1:
+                self._ends[-1] = pk
+            else:
+                self._starts.append(pk)
+                self._ends.append(pk)
+                self._offsets.append(self._size)
+            self._size += 1
+
+    def __getitem__(self, index):
+        segment = bisect.bisect_right(self._offsets, index) - 1
+        return self._starts[segment] + index - self._offsets[segment]
+
+    def choice(self, rng):
+        return self[rng.randrange(self._size)]
+
+    def sample(self, rng, k):
+        return [self[index] for index in rng.sample(range(self._size), k)]
+
+
+@contextmanager
+def explicit_created_at(model):
+    """Отключает auto_now_add на время одного bulk_create, чтобы сохранились сгенерированные даты.
+
+    Поле модели - общий объект процесса, поэтому окно минимальное (один пакет), а исходное
+    значение возвращается в finally, даже если вставка упала.
+    """
+    fields = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class DatasetSeeder:
+    """Заполняет БД потоково, пакетами bulk_create (или COPY на PostgreSQL).
+
+    Объекты генерируются лениво, в памяти держится только текущий пакет и пулы id,
+    поэтому потребление памяти не зависит от объема. Одинаковый seed дает одинаковые данные.
+    """
+
+    def __init__(self, config, stdout=None):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.stdout = stdout
+        self.user_ids = IdPool()
+        self.leaf_categories = []
+        self.listing_ids = IdPool()
+        if config.use_copy and connection.vendor != 'postgresql':
+            raise ValueError("COPY поддерживается только на PostgreSQL")
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def run(self):
+        self.seed_users()
+        self.seed_categories()
+        self.seed_listings()
+        self.seed_images()
+        self.seed_favorites()
+        self.seed_reviews()
+        self.seed_messages()
+        # bulk_create и COPY не вызывают сигналы - пересчитываем денормализованные агрегаты
+        call_command('recompute_ratings', stdout=StringIO())
+        call_command('reconcile_favorites_count', stdout=StringIO())
+        return self.summary()
+
+    def summary(self):
+        return {
+            'config': asdict(self.config),
+            'users': User.objects.count(),
+            'categories': Category.objects.count(),
+            'listings': Listing.objects.count(),
+            'images': Image.objects.count(),
+            'favorites': Favorite.objects.count(),
+            'reviews': Review.objects.count(),
+            'messages': Message.objects.count(),
+        }
+
+    def random_moment(self):
+        return EPOCH + timedelta(seconds=self.rng.randrange(self.config.days * 86400))
+
+    def _insert(self, model, objects):
+        """Потоковая вставка пакетами, каждый пакет в своей транзакции; возвращает пул созданных pk"""
+        flush = self._copy if self.config.use_copy else self._bulk_create
+        ids = IdPool()
+        batch = []
+        started = time.perf_counter()
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.config.batch_size:
+                ids.extend(flush(model, batch))
+                batch = []
+                if len(ids) % (self.config.batch_size * 100) == 0:
+                    self.log(f"  {model._meta.db_table}: {len(ids)}")
+        if batch:
+            ids.extend(flush(model, batch))
+        elapsed = time.perf_counter() - started
+        self.log(f"{model._meta.db_table}: {len(ids)} за {elapsed:.1f} с ({len(ids) / max(elapsed, 1e-6):.0f}/с)")
+        return ids
+
+    @staticmethod
+    def _bulk_create(model, batch):
+        with transaction.atomic(), explicit_created_at(model):
+            created = model.objects.bulk_create(batch)
+        return [obj.pk for obj in created]
+
+    def _copy(self, model, batch):
+        """COPY FROM STDIN в текстовом формате; id заранее берутся из последовательности таблицы"""
+        table = connection.ops.quote_name(model._meta.db_table)
+        fields = model._meta.concrete_fields
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", [table, len(batch)]
+            )
+            for obj, (pk,) in zip(batch, cursor.fetchall()):
+                obj.pk = pk
+
+            buffer = StringIO()
+            for obj in batch:
+                buffer.write('\t'.join(_copy_value(getattr(obj, field.attname)) for field in fields))
+                buffer.write('\n')
+            buffer.seek(0)
+            columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+            cursor.cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+        return [obj.pk for obj in batch]
+
+    def seed_users(self):
+        role, _ = Role.objects.get_or_create(id=2, defaults={'name': 'user'})
+        # Хеширование пароля дорогое - один хеш на всех
+        password = make_password('bench-password')
+        # Суффикс от seed позволяет досеивать данные в ту же БД с другим seed
+        suffix = f'{self.config.seed}_'
+        self.user_ids = self._insert(User, (
+            User(
+                username=f'bench_user_{suffix}{i}', email=f'bench_user_{suffix}{i}@bench.local', password=password,
+                role_id=role.id, email_verified=True, is_active=True, phone_number=f'+7900{i:07d}'[:15],
+            )
+            for i in range(self.config.users)
+        ))
+
+    def seed_categories(self):
+        level = [None]
+        for depth in range(self.config.category_depth):
+            created = []
+            for parent in level:
+                for i in range(self.config.category_fanout):
+                    name = f'Категория {depth + 1}.{i + 1}'
+                    if parent is None:
+                        name = f'{name} ({self.config.seed})'
+                    created.append(Category(name=name, parent=parent))
+            with transaction.atomic():
+                level = Category.objects.bulk_create(created)
+                FilterAttribute.objects.bulk_create(
+                    attribute for category in level for attribute in self.filter_schema(category)
+                )
+        self.leaf_categories = list(
+            Category.objects.filter(pk__in=[category.pk for category in level]).prefetch_related('filters').order_by('pk')
+        )
+        self.log(f"Categories: листьев {len(self.leaf_categories)}")
+
+    def filter_schema(self, category):
+        return [
+            FilterAttribute(name='Состояние', attribute_type='select', category=category, options=CONDITIONS),
+            FilterAttribute(name='Цвет', attribute_type='select', category=category, options=COLORS),
+            FilterAttribute(
+                name='Вес', attribute_type='number', category=category,
+                min_value=0.1, max_value=self.rng.choice([5, 50, 500]), unit='кг',
+            ),
+            FilterAttribute(name='Доставка', attribute_type='checkbox', category=category),
+        ]
+
+    def attribute_values(self, category):
+        values = {}
+        for attribute in category.filters.all():
+            if attribute.attribute_type == 'select' and attribute.options:
+                values[attribute.name] = self.rng.choice(attribute.options)
+            elif attribute.attribute_type in ('number', 'range'):
+                low = attribute.min_value or 0
+                high = attribute.max_value or 1000
+                values[attribute.name] = round(self.rng.uniform(low, high), 1)
+            elif attribute.attribute_type == 'checkbox':
+                values[attribute.name] = self.rng.random() < 0.5
+            else:
+                values[attribute.name] = self.rng.choice(WORDS)
+        return values
+
+    def seed_listings(self):
+        def listings():
+            for i in range(self.config.listings):
+                category = self.rng.choice(self.leaf_categories)
+                words = self.rng.sample(WORDS, 3)
+                yield Listing(
+                    title=f"{words[0].capitalize()} {category.name} #{i}",
+                    description=' '.join(self.rng.choices(WORDS, k=30)),
+                    price=Decimal(self.rng.randint(100, 500000)) / 100,
+                    address=f"г. {self.rng.choice(CITIES)}, ул. {self.rng.choice(WORDS)}, {self.rng.randint(1, 200)}",
+                    created_at=self.random_moment(),
+                    user_id=self.user_ids.choice(self.rng),
+                    category_id=category.id,
+                    attributes=self.attribute_values(category),
+                )
+
+        self.listing_ids = self._insert(Listing, listings())
+
+    def seed_images(self):
+        def images():
+            for listing_id in self.listing_ids:
+                for n in range(self.rng.randint(1, self.config.images_per_listing)):
+                    yield Image(listing_id=listing_id, url=f'https://i.ibb.co/bench/{listing_id}-{n}.jpg')
+
+        self._insert(Image, images())
+
+    def seed_favorites(self):
+        per_user = min(self.config.favorites_per_user, len(self.listing_ids))
+
+        def favorites():
+            for user_id in self.user_ids:
+                for listing_id in self.listing_ids.sample(self.rng, per_user):
+                    yield Favorite(user_id=user_id, listing_id=listing_id)
+
+        self._insert(Favorite, favorites())
+
+    def seed_reviews(self):
+        def reviews():
+            for _ in range(self.config.reviews):
+                reviewer_id, reviewed_id = self.user_ids.sample(self.rng, 2)
+                yield Review(
+                    reviewer_id=reviewer_id, reviewed_id=reviewed_id,
+                    rating=self.rng.choices(range(1, 6), weights=[1, 1, 2, 4, 8])[0],
+                    comment=' '.join(self.rng.choices(WORDS, k=12)),
+                    created_at=self.random_moment(),
+                )
+
+        if len(self.user_ids) > 1:
+            self._insert(Review, reviews())
+
+    def seed_messages(self):
+        def messages():
+            for _ in range(self.config.threads):
+                first, second = self.user_ids.sample(self.rng, 2)
+                moment = self.random_moment()
+                for n in range(self.config.messages_per_thread):
+                    sender, receiver = (first, second) if n % 2 == 0 else (second, first)
+                    moment += timedelta(minutes=self.rng.randint(1, 600))
+                    yield Message(
+                        sender_id=sender, receiver_id=receiver,
+                        content=' '.join(self.rng.choices(WORDS, k=8)),
+                        created_at=moment,
+                        is_read=n < self.config.messages_per_thread - 1,
+                    )
+
+        if len(self.user_ids) > 1:
+            self._insert(Message, messages())
+
+
+def _copy_value(value):
+    """Значение поля в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
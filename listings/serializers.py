@@ -1,9 +1,8 @@
 import json
-import uuid
+import logging
 import time
 
 import requests
-import django.utils.timezone as timezone
 from django.contrib.messages.storage import default_storage
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
@@ -12,7 +11,10 @@ from django.contrib.auth.hashers import make_password, check_password
 
 from SellUp import settings
 from .models import Role, User, Category, Listing, Image, Favorite, Review, ListingCategory, Message, FilterAttribute
-from .views import logger
+from .metrics import observe_image_upload
+from .timing import timed
+
+logger = logging.getLogger(__name__)
 
 
 # Сериализатор для ролей
@@ -22,6 +24,17 @@ class RoleSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 
+# Сериализатор для агрегатов рейтинга (хранятся в User, см. signals.py)
+class UserRatingSerializer(serializers.ModelSerializer):
+    average = serializers.FloatField(source='rating_average', read_only=True)
+    count = serializers.IntegerField(source='rating_count', read_only=True)
+    histogram = serializers.DictField(source='rating_histogram', read_only=True)
+
+    class Meta:
+        model = User
+        fields = ['average', 'count', 'histogram']
+
+
 # Сериализатор для пользователей
 class UserProfileSerializer(serializers.ModelSerializer):
     role = RoleSerializer(read_only=True)
@@ -33,11 +46,12 @@ class UserProfileSerializer(serializers.ModelSerializer):
         allow_null=True,
     )
     email_address = serializers.EmailField(source='email', read_only=True)
+    rating = UserRatingSerializer(source='*', read_only=True)
 
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'email_address', 'phone_number', 'role', 'role_id', 'email_verified',
-                  'is_active']
+                  'is_active', 'rating']
         extra_kwargs = {
             'email': {'read_only': True},
             'email_verified': {'read_only': True},
@@ -109,8 +123,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
 
         user.set_password(validated_data['password'])
-        user.email_verification_token = str(uuid.uuid4())
-        user.email_verification_sent_at = timezone.now()
+        # Токен подтверждения почты выдает RegisterView вместе с отправкой письма
         user.save()
         return user
 
@@ -170,11 +183,22 @@ class CategoryTreeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'parent', 'children', 'filters']
 
     def get_children(self, obj):
-        if obj.children.exists():
-            return CategoryTreeSerializer(obj.children.all(), many=True).data
+        # category_children - дерево, заранее собранное одним запросом (см. build_category_children)
+        children_map = self.context.get('category_children')
+        children = children_map.get(obj.id) if children_map is not None else list(obj.children.all())
+        if children:
+            return CategoryTreeSerializer(children, many=True, context=self.context).data
         return None
 
 
+def build_category_children():
+    """Все категории одним запросом (+ фильтры), сгруппированные по parent_id"""
+    children = {}
+    for category in Category.objects.prefetch_related('filters').order_by('id'):
+        children.setdefault(category.parent_id, []).append(category)
+    return children
+
+
 # Сериализатор для категорий (упрощенный)
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -217,13 +241,14 @@ class ListingSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'description', 'price', 'address', 'created_at',
             'user', 'images', 'categories', 'category', 'category_id',
-            'attributes', 'filters'
+            'attributes', 'filters', 'favorites_count'
         ]
         extra_kwargs = {
             'title': {'required': True},
             'price': {'required': True},
             'address': {'required': True},
-            'attributes': {'required': False}
+            'attributes': {'required': False},
+            'favorites_count': {'read_only': True},
         }
 
     def get_filters(self, obj):
@@ -285,7 +310,7 @@ class ListingSerializer(serializers.ModelSerializer):
                         )
                         success_count += 1
                     except Exception as e:
-                        logger.error(f"Ошибка загрузки изображения: {str(e)}")
+                        logger.error("Ошибка загрузки изображения: %s", e)
                         continue
 
                 if success_count == 0:
@@ -296,14 +321,16 @@ class ListingSerializer(serializers.ModelSerializer):
                 return listing
 
         except Exception as e:
-            logger.error(f"Ошибка создания объявления: {str(e)}")
+            logger.error("Ошибка создания объявления: %s", e)
             raise serializers.ValidationError(
                 {"error": f"Ошибка при создании объявления: {str(e)}"}
             )
 
+    @timed('imgbb')
+    @observe_image_upload('form')
     def _upload_to_imgbb(self, image_file):
         """Загрузка изображения на imgBB с использованием API ключа"""
-        logger.info(f"Начинаем загрузку изображения на imgBB: {image_file.name}, размер: {image_file.size} байт")
+        logger.info("Начинаем загрузку изображения на imgBB: %s, размер: %s байт", image_file.name, image_file.size)
 
         try:
             image_file.seek(0)
@@ -336,14 +363,39 @@ class ListingSerializer(serializers.ModelSerializer):
                 raise ValueError(f"Ошибка imgBB: {error}")
 
             image_url = data['data']['url']
-            logger.info(f"Изображение успешно загружено на imgBB: {image_url}")
+            logger.info("Изображение успешно загружено на imgBB: %s", image_url)
             return image_url
 
         except Exception as e:
-            logger.error(f"Ошибка загрузки изображения на imgBB: {str(e)}")
+            logger.error("Ошибка загрузки изображения на imgBB: %s", e)
             raise Exception("Ошибка загрузки изображения. Попробуйте позже.")
 
 
+# Продавец в карточке объявления: только то, что нужно для отображения
+class SellerCardSerializer(serializers.ModelSerializer):
+    rating = serializers.FloatField(source='rating_average', read_only=True)
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'rating', 'rating_count']
+
+
+# Компактная карточка объявления (сетка, избранное) без фильтров и полного профиля
+class ListingCardSerializer(serializers.ModelSerializer):
+    category = CategorySerializer(read_only=True)
+    user = SellerCardSerializer(read_only=True)
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Listing
+        fields = ['id', 'title', 'price', 'address', 'created_at', 'category', 'user', 'image', 'favorites_count']
+
+    def get_image(self, obj):
+        # images должны быть подгружены через prefetch_related
+        images = obj.images.all()
+        return images[0].url if images else None
+
+
 # Сериализатор для избранных
 class FavoriteSerializer(serializers.ModelSerializer):
     listing = ListingSerializer(read_only=True)
@@ -354,6 +406,14 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = ['id', 'listing', 'listing_id']
 
 
+class FavoriteCardSerializer(serializers.ModelSerializer):
+    listing = ListingCardSerializer(read_only=True)
+
+    class Meta:
+        model = Favorite
+        fields = ['id', 'listing']
+
+
 # Сериализатор для отзывов
 class ReviewSerializer(serializers.ModelSerializer):
     reviewer = serializers.SerializerMethodField()
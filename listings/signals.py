@@ -0,0 +1,170 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user
+from .counters import get_favorites_counter
+from .models import Category, FilterAttribute, Image, Listing, ListingCategory, Message, Review, Role, User, Favorite
+from .projections import USER_FIELDS
+from .realtime import publish_new_message, publish_read_receipt
+from .response_cache import invalidate as invalidate_responses
+
+
+# Доставка сообщений и отметок о прочтении подписчикам WebSocket
+@receiver(pre_save, sender=Message)
+def remember_message_read_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._was_read = None
+    if instance.pk and not raw and instance.is_read and (update_fields is None or 'is_read' in update_fields):
+        instance._was_read = Message.objects.filter(pk=instance.pk).values_list('is_read', flat=True).first()
+
+
+@receiver(post_save, sender=Message)
+def push_message(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        transaction.on_commit(lambda: publish_new_message(instance))
+    # Отметка о прочтении - только при переходе is_read False -> True, не на каждое сохранение
+    elif instance.is_read and getattr(instance, '_was_read', None) is False:
+        transaction.on_commit(lambda: publish_read_receipt(
+            instance.receiver_id, instance.sender_id, message_ids=[instance.id]
+        ))
+
+
+# Денормализованные агрегаты рейтинга продавца (User.rating_*)
+def apply_review_rating(user_id, rating, sign):
+    """Атомарно добавляет (sign=1) или убирает (sign=-1) оценку из агрегатов пользователя"""
+    User.objects.filter(pk=user_id).update(**{
+        'rating_count': F('rating_count') + sign,
+        'rating_sum': F('rating_sum') + sign * rating,
+        f'rating_{rating}': F(f'rating_{rating}') + sign,
+    })
+    # Профиль берется из закешированного при аутентификации пользователя; рейтинг продавца
+    # входит в карточки объявлений
+    transaction.on_commit(lambda: invalidate_user(user_id))
+    transaction.on_commit(lambda: invalidate_responses('listings'))
+
+
+# Прежняя оценка читается с блокировкой строки до конца транзакции Review.save()/delete():
+# иначе две одновременные правки отзыва вычли бы из агрегатов одну и ту же старую оценку
+def locked_review_rating(pk):
+    return Review.objects.select_for_update().filter(pk=pk).values_list('reviewed_id', 'rating').first()
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = locked_review_rating(instance.pk)
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if previous == (instance.reviewed_id, instance.rating):
+        return
+    if previous:
+        apply_review_rating(previous[0], previous[1], -1)
+    apply_review_rating(instance.reviewed_id, instance.rating, 1)
+
+
+@receiver(pre_delete, sender=Review)
+def remember_deleted_review_rating(sender, instance, **kwargs):
+    # Экземпляр мог устареть: вычитается оценка, сохраненная в БД
+    instance._previous_rating = locked_review_rating(instance.pk)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    reviewed_id, rating = getattr(instance, '_previous_rating', None) or (instance.reviewed_id, instance.rating)
+    apply_review_rating(reviewed_id, rating, -1)
+
+
+# Счетчик избранного на объявлении: приращения копятся в буфере и сбрасываются пачкой
+@receiver(post_save, sender=Favorite)
+def count_favorite_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        listing_id = instance.listing_id
+        transaction.on_commit(lambda: get_favorites_counter().add(listing_id, 1))
+
+
+@receiver(post_delete, sender=Favorite)
+def count_favorite_removed(sender, instance, **kwargs):
+    listing_id = instance.listing_id
+    transaction.on_commit(lambda: get_favorites_counter().add(listing_id, -1))
+
+
+# Кеш CachedTokenAuthentication: сброс при изменении пользователя (пароль, is_active, профиль)
+# и при удалении или перевыпуске токена. Сброс - после фиксации: до нее параллельный запрос
+# прочитал бы из БД старую строку и снова положил ее в кеш до CACHE_TTL
+@receiver(post_save, sender=User)
+def invalidate_user_auth(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(post_save, sender=Token)
+def invalidate_rotated_token(sender, instance, created, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: invalidate_token(key))
+
+
+# Кеш готовых ответов (response_cache): новая версия группы после коммита изменения.
+# Категории и их фильтры входят и в дерево, и в карточки объявлений; продавец с ролью -
+# в карточки объявлений. Изменения в обход сигналов (bulk_create импорта, счетчики,
+# пересчет рейтинга) сбрасывают кеш сами
+RESPONSE_CACHE_GROUPS = {
+    Category: ('categories', 'listings'),
+    FilterAttribute: ('categories', 'listings'),
+    Listing: ('listings',),
+    Image: ('listings',),
+    ListingCategory: ('listings',),
+    User: ('listings',),
+    Role: ('listings',),
+}
+
+
+# Поля продавца в карточках объявлений (projections.USER_FIELDS без id и связанных моделей)
+LISTING_CARD_USER_FIELDS = tuple(field for field in USER_FIELDS[1:] if '__' not in field)
+_LISTING_CARD_USER_NAMES = {name for field in LISTING_CARD_USER_FIELDS
+                            for name in (field, User._meta.get_field(field).name)}
+
+
+@receiver(pre_save, sender=User)
+def remember_listing_card_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Меняет ли сохранение продавца карточки его объявлений: вход, регистрация, токены
+    сброса пароля и подтверждения email выдачу не сбрасывают"""
+    instance._listing_card_changed = False
+    if raw or instance._state.adding:
+        # У нового пользователя объявлений еще нет
+        return
+    if update_fields is not None and not _LISTING_CARD_USER_NAMES.intersection(update_fields):
+        return
+    stored = User.objects.filter(pk=instance.pk).values(*LISTING_CARD_USER_FIELDS).first()
+    instance._listing_card_changed = stored is None or any(
+        stored[field] != getattr(instance, field) for field in LISTING_CARD_USER_FIELDS
+    )
+
+
+def invalidate_cached_responses(sender, instance, signal, raw=False, **kwargs):
+    if raw or (sender is User and signal is post_save and not getattr(instance, '_listing_card_changed', True)):
+        return
+    groups = RESPONSE_CACHE_GROUPS[sender]
+    transaction.on_commit(lambda: invalidate_responses(*groups))
+
+
+for model in RESPONSE_CACHE_GROUPS:
+    post_save.connect(invalidate_cached_responses, sender=model, dispatch_uid=f'response_cache_save_{model.__name__}')
+    post_delete.connect(invalidate_cached_responses, sender=model, dispatch_uid=f'response_cache_delete_{model.__name__}')
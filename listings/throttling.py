@@ -0,0 +1,234 @@
+"""Ограничение частоты запросов по алгоритму token bucket."""
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+DEFAULTS = {
+    'ENABLED': True,
+    'STORE': 'memory',
+    'CACHE_ALIAS': 'default',
+    'MAX_KEYS': 100000,
+    # Число доверенных обратных прокси перед приложением; 0 - X-Forwarded-For не читается
+    'NUM_PROXIES': 0,
+    'RATES': {},
+}
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+_RATE_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([a-z]+)\s*(?::\s*(\d+))?\s*$')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'THROTTLING', {})}
+
+
+def parse_rate(rate):
+    """'10/min' - 10 запросов в минуту; '60/min:120' - то же с запасом (burst) на 120 запросов.
+
+    Возвращает (емкость корзины, пополнение в токенах за секунду).
+    """
+    match = _RATE_RE.match(rate)
+    if match is None or match.group(3) not in PERIODS:
+        raise ValueError(f"Некорректный лимит: {rate}")
+    count, multiplier, unit, burst = match.groups()
+    period = int(multiplier or 1) * PERIODS[unit]
+    return int(burst or count), int(count) / period
+
+
+def client_ip(request, num_proxies=None):
+    """IP клиента для лимитов и проверок доступа (по умолчанию num_proxies = THROTTLING['NUM_PROXIES']).
+
+    Без прокси - REMOTE_ADDR: X-Forwarded-For задает сам клиент, и каждый новый адрес в нем
+    давал бы новую корзину. За num_proxies доверенными прокси - адрес, который записал
+    в X-Forwarded-For самый внешний из них (как NUM_PROXIES в DRF).
+    """
+    if num_proxies is None:
+        num_proxies = get_config()['NUM_PROXIES']
+    if num_proxies > 0:
+        addresses = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        addresses = [address for address in addresses if address]
+        if addresses:
+            return addresses[-min(num_proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def take(state, capacity, refill_rate, now, cost=1):
+    """Один шаг token bucket: возвращает (разрешено, ожидание в секундах, новое состояние)"""
+    if state is None:
+        tokens = capacity
+    else:
+        tokens, updated = state
+        tokens = min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+    if tokens >= cost:
+        return True, 0.0, (tokens - cost, now)
+    return False, (cost - tokens) / refill_rate, (tokens, now)
+
+
+class InMemoryBucketStore:
+    """Корзины в памяти процесса: без сетевых вызовов, но лимит считается на каждый воркер отдельно"""
+
+    def __init__(self, max_keys=DEFAULTS['MAX_KEYS']):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            allowed, wait, state = take(self._buckets.pop(key, None), capacity, refill_rate, now, cost)
+            self._buckets[key] = state
+            # Вытесняем давно не использованные ключи, чтобы перебор IP не раздувал память
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+
+class CacheBucketStore:
+    """Корзины в общем кеше Django (Redis/memcached) для нескольких узлов.
+
+    Чтение и запись не атомарны: при одновременных запросах с разных узлов лимит может
+    быть превышен на несколько запросов, что для защиты от скрейперов допустимо.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        now = time.time()
+        allowed, wait, state = take(self.cache.get(key), capacity, refill_rate, now, cost)
+        # Через время полного пополнения корзина неотличима от новой - ключ можно отпустить
+        self.cache.set(key, state, timeout=math.ceil(capacity / refill_rate) + 1)
+        return allowed, wait
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = get_config()
+                if config['STORE'] == 'cache':
+                    _store = CacheBucketStore(config['CACHE_ALIAS'])
+                else:
+                    _store = InMemoryBucketStore(config['MAX_KEYS'])
+    return _store
+
+
+def reset_bucket_store():
+    global _store
+    with _store_lock:
+        _store = None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Базовый throttle: область (scope) и лимиты берутся с представления.
+
+    throttle_scope на представлении - строка или словарь {action: scope}, как query_budget;
+    throttle_rates на представлении переопределяет THROTTLING['RATES']. Без области или
+    лимита запрос пропускается.
+    """
+
+    scope = None
+    # Атрибут представления с областью: у разных throttle на одном представлении области свои
+    scope_attr = 'throttle_scope'
+    # Нужен ли request.user: такие лимиты ThrottleFirstMixin проверяет после аутентификации
+    requires_user = False
+
+    def get_scope(self, view):
+        scope = getattr(view, self.scope_attr, None) or self.scope
+        if isinstance(scope, dict):
+            return scope.get(getattr(view, 'action', None))
+        return scope
+
+    def get_rate(self, view, scope):
+        rates = {**get_config()['RATES'], **(getattr(view, 'throttle_rates', None) or {})}
+        return rates.get(scope)
+
+    def get_ident(self, request):
+        return client_ip(request)
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self._wait = None
+        if not get_config()['ENABLED']:
+            return True
+        scope = self.get_scope(view)
+        rate = scope and self.get_rate(view, scope)
+        if not rate:
+            return True
+        capacity, refill_rate = parse_rate(rate)
+        key = f'throttle:{scope}:{self.get_ident_key(request)}'
+        allowed, self._wait = get_bucket_store().consume(key, capacity, refill_rate)
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class IPThrottle(TokenBucketThrottle):
+    """Лимит по IP; request.user не трогает, поэтому вместе с ThrottleFirstMixin проверяется до аутентификации"""
+
+    def get_ident_key(self, request):
+        return f'ip:{self.get_ident(request)}'
+
+
+class UserThrottle(TokenBucketThrottle):
+    """Лимит по пользователю, для анонимов - по IP.
+
+    Область - user_throttle_scope представления (строка или {action: scope}): корзина
+    пользователя не зависит от корзины его IP, и несколько аккаунтов за одним NAT
+    не делят лимит записи.
+    """
+
+    scope_attr = 'user_throttle_scope'
+    requires_user = True
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+
+class ThrottleFirstMixin:
+    """Проверяет лимиты до аутентификации.
+
+    DRF проверяет лимиты после аутентификации и прав; с этой примесью лимиты по IP
+    отсекают запрос раньше, чем сессия или токен будут прочитаны из БД. Сама
+    аутентификация выполняется сразу после них, как обычно: неверный токен дает 401
+    и там, где права пускают анонимов. Лимиты по пользователю (requires_user)
+    проверяются после аутентификации, на обычном месте DRF.
+    """
+
+    def perform_authentication(self, request):
+        self.apply_throttles(request, [throttle for throttle in self.get_throttles()
+                                       if not getattr(throttle, 'requires_user', False)])
+        self._throttles_checked = True
+        super().perform_authentication(request)
+
+    def check_throttles(self, request):
+        if not getattr(self, '_throttles_checked', False):
+            return super().check_throttles(request)
+        self.apply_throttles(request, [throttle for throttle in self.get_throttles()
+                                       if getattr(throttle, 'requires_user', False)])
+
+    def apply_throttles(self, request, throttles):
+        # Как APIView.check_throttles, но по заданному списку
+        durations = [throttle.wait() for throttle in throttles if not throttle.allow_request(request, self)]
+        if durations:
+            self.throttled(request, max((duration for duration in durations if duration is not None), default=None))
+
+
+def scoped(scope, base=IPThrottle):
+    """Throttle с фиксированной областью - для функций-представлений (@throttle_classes)"""
+    return type(f'{base.__name__}_{scope}', (base,), {'scope': scope})
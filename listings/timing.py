@@ -0,0 +1,158 @@
+"""Замер фаз запроса (Server-Timing) и выборочное профилирование cProfile."""
+import contextvars
+import cProfile
+import itertools
+import logging
+import os
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .throttling import client_ip
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Заголовок раскрывает клиенту время БД и внешних вызовов: по умолчанию - только INTERNAL_IPS
+    'HEADER': False,
+    'PROFILE_EVERY_N': 0,
+    'PROFILE_SLOW_MS': 0,
+    'PROFILE_DIR': 'profiles',
+}
+
+_current = contextvars.ContextVar('request_timings', default=None)
+_SLUG_RE = re.compile(r'[^A-Za-z0-9]+')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SERVER_TIMING', {})}
+
+
+class RequestTimings:
+    """Суммарная длительность (мс) и число вызовов по фазам одного запроса"""
+
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, name, seconds):
+        total, count = self.phases.get(name, (0.0, 0))
+        self.phases[name] = (total + seconds * 1000, count + 1)
+
+    def as_dict(self):
+        return {name: round(total, 2) for name, (total, _) in self.phases.items()}
+
+    def header(self):
+        # Фазы могут пересекаться: запросы аутентификации входят и в auth, и в db
+        parts = []
+        for name, (total, count) in self.phases.items():
+            part = f'{name};dur={total:.2f}'
+            if count > 1:
+                part += f';desc="{count}x"'
+            parts.append(part)
+        return ', '.join(parts)
+
+
+@contextmanager
+def phase(name):
+    """Замер фазы текущего запроса; вне запроса ничего не делает"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _db_timer(execute, sql, params, many, context):
+    with phase('db'):
+        return execute(sql, params, many, context)
+
+
+class ServerTimingMiddleware:
+    """Фазы запроса в заголовке Server-Timing и в request.server_timing (поле журнала доступа).
+
+    db - все SQL-запросы, view - представление до рендеринга, render - рендеринг ответа DRF,
+    auth/imgbb/smtp - участки, размеченные phase()/timed(). Опционально каждый
+    PROFILE_EVERY_N-й запрос профилируется cProfile, дамп сохраняется, если запрос
+    дольше PROFILE_SLOW_MS. Заголовок отдается всем при HEADER, иначе только запросам
+    с адресов INTERNAL_IPS; в журнал доступа фазы попадают всегда.
+    """
+
+    def __init__(self, get_response):
+        self.config = get_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.every_n = self.config['PROFILE_EVERY_N']
+        self.counter = itertools.count(1)
+        if self.every_n:
+            os.makedirs(self.config['PROFILE_DIR'], exist_ok=True)
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = cProfile.Profile() if self.every_n and next(self.counter) % self.every_n == 0 else None
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_db_timer))
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _current.reset(token)
+
+        elapsed = time.perf_counter() - started
+        timings.add('total', elapsed)
+        request.server_timing = timings.as_dict()
+        if self.config['HEADER'] or client_ip(request) in settings.INTERNAL_IPS:
+            response['Server-Timing'] = timings.header()
+        if profiler is not None and elapsed * 1000 >= self.config['PROFILE_SLOW_MS']:
+            self.dump(profiler, request, elapsed)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Django вызывает этот хук прямо перед response.render()
+        timings = _current.get()
+        if timings is not None and hasattr(request, '_view_started'):
+            render_started = time.perf_counter()
+            timings.add('view', render_started - request._view_started)
+            response.add_post_render_callback(
+                lambda rendered: timings.add('render', time.perf_counter() - render_started)
+            )
+        return response
+
+    def dump(self, profiler, request, elapsed):
+        slug = _SLUG_RE.sub('-', request.path).strip('-')[:80] or 'root'
+        request_id = getattr(request, 'request_id', '')
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{elapsed * 1000:.0f}ms-{request.method}-{slug}-{request_id}.prof"
+        path = os.path.join(self.config['PROFILE_DIR'], name)
+        profiler.dump_stats(path)
+        logger.info("Профиль %s %s сохранен в %s", request.method, request.path, path)
@@ -0,0 +1,44 @@
+"""Одноразовые токены подтверждения почты и сброса пароля.
+
+В БД хранится только SHA-256 от токена (индексированная колонка), сам токен уходит в письмо.
+"""
+import hashlib
+import uuid
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import User
+
+EMAIL_VERIFICATION_FIELD = 'email_verification_token'
+PASSWORD_RESET_FIELD = 'password_reset_token'
+PASSWORD_RESET_TOKEN_TTL = timedelta(hours=24)
+
+
+def hash_token(raw_token):
+    return hashlib.sha256(raw_token.encode()).hexdigest()
+
+
+def issue_email_verification_token(user):
+    """Выставляет пользователю новый токен (без сохранения) и возвращает его открытое значение"""
+    raw_token = str(uuid.uuid4())
+    user.email_verification_token = hash_token(raw_token)
+    user.email_verification_sent_at = timezone.now()
+    return raw_token
+
+
+def issue_password_reset_token(user):
+    raw_token = str(uuid.uuid4())
+    user.password_reset_token = hash_token(raw_token)
+    user.password_reset_token_created = timezone.now()
+    return raw_token
+
+
+def users_by_token(field, raw_token):
+    """Поиск по индексу хеша токена; field - EMAIL_VERIFICATION_FIELD или PASSWORD_RESET_FIELD"""
+    return User.objects.filter(**{field: hash_token(raw_token)})
+
+
+def password_reset_expired(user):
+    created = user.password_reset_token_created
+    return created is None or timezone.now() > created + PASSWORD_RESET_TOKEN_TTL
@@ -2,7 +2,7 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 from .views import RegisterView, LoginView, LogoutView, CurrentUserView, ProfileView, ConfirmEmailView, csrf, \
     MyListingsView, MyFavoritesView, MessageViewSet, request_password_reset, validate_reset_token, reset_password
 from rest_framework.authtoken.views import obtain_auth_token
@@ -34,4 +34,10 @@ urlpatterns = [
     path('request-password-reset/', request_password_reset, name='request-password-reset'),
     path('validate-reset-token/<str:token>/', validate_reset_token, name='validate-reset-token'),
     path('reset-password/<str:token>/', reset_password, name='reset-password'),
+
+    # Асинхронные версии эндпоинтов чтения для ASGI (listings.async_views)
+    path('async/listings/', async_views.listing_list, name='async-listing-list'),
+    path('async/listings/<int:pk>/', async_views.listing_detail, name='async-listing-detail'),
+    path('async/categories/', async_views.category_tree, name='async-category-tree'),
+    path('async/messages/conversations/', async_views.conversations, name='async-conversations'),
 ]
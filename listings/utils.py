@@ -1,18 +1,23 @@
 import os
 import base64
+import logging
 import pickle
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from email.mime.text import MIMEText
 
 from SellUp import settings
 
+logger = logging.getLogger(__name__)
+
 # Путь к токену
 TOKEN_PATH = os.path.join(settings.BASE_DIR, 'config', 'token.pickle')
 
 
 def get_gmail_service():
     """Получение авторизованного сервиса Gmail"""
+    # Клиентские библиотеки Google тяжелые - импортируем только при отправке
+    from google.auth.transport.requests import Request
+    from googleapiclient.discovery import build
+
     creds = None
     if os.path.exists(TOKEN_PATH):
         with open(TOKEN_PATH, 'rb') as token_file:
@@ -25,7 +30,7 @@ def get_gmail_service():
         # Сохранение обновленного токена в файл
         with open(TOKEN_PATH, 'wb') as token_file:
             pickle.dump(creds, token_file)
-            print(f"Токен обновлен и сохранен в {TOKEN_PATH}")
+            logger.info("Токен обновлен и сохранен в %s", TOKEN_PATH)
 
     # Создание Gmail API сервиса
     service = build('gmail', 'v1', credentials=creds)
@@ -48,14 +53,16 @@ def send_gmail(subject, message, to_email):
             'raw': encoded_message
         }
         service.users().messages().send(userId='me', body=send_message).execute()
-        print(" Письмо успешно отправлено!")
+        logger.info("Письмо успешно отправлено на %s", to_email)
 
     except Exception as e:
-        print(f" Ошибка при отправке письма: {e}")
+        logger.error("Ошибка при отправке письма на %s: %s", to_email, e)
 
 
 def get_gmail_credentials():
     """Загружает токен из файла и обновляет его при необходимости"""
+    from google.auth.transport.requests import Request
+
     creds = None
 
     # Проверка существования файла
@@ -64,7 +71,7 @@ def get_gmail_credentials():
             with open(TOKEN_PATH, 'rb') as token_file:
                 creds = pickle.load(token_file)
         except Exception as e:
-            print(f"Ошибка при загрузке токена: {e}")
+            logger.error("Ошибка при загрузке токена: %s", e)
             return None
 
     # Обновление токена, если истек
@@ -74,6 +81,6 @@ def get_gmail_credentials():
         # Сохранение обновленного токена в файл
         with open(TOKEN_PATH, 'wb') as token_file:
             pickle.dump(creds, token_file)
-            print(f"Токен обновлен и сохранен в {TOKEN_PATH}")
+            logger.info("Токен обновлен и сохранен в %s", TOKEN_PATH)
 
     return creds
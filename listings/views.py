@@ -2,25 +2,25 @@ import json
 import logging
 import random
 import string
-import uuid
-from datetime import timedelta
 from itertools import chain
-from venv import logger
 
 from django.contrib.auth import login, logout, get_user_model
 from django.contrib.auth.hashers import make_password
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
 from django.core.mail import send_mail
-from django.db.models import Q, Prefetch
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import F, Q, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.http import JsonResponse, StreamingHttpResponse
 from django.middleware.csrf import get_token
 from django.utils import timezone
 from django.views import View
 from rest_framework import viewsets, status, permissions, generics
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action, api_view
-from rest_framework.decorators import authentication_classes, permission_classes
+from rest_framework.decorators import authentication_classes, permission_classes, throttle_classes
 from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, JSONParser
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
@@ -33,7 +33,21 @@ from SellUp import settings
 from .models import Role, User, Category, Listing, Image, Favorite, Review, ListingCategory, Message, FilterAttribute, PasswordResetToken
 from .serializers import RoleSerializer, UserProfileSerializer, CategorySerializer, ListingSerializer, ImageSerializer, \
     FavoriteSerializer, ReviewSerializer, ListingCategorySerializer, RegisterSerializer, LoginSerializer, \
-    MessageSerializer, CategoryTreeSerializer, FilterAttributeSerializer
+    MessageSerializer, CategoryTreeSerializer, FilterAttributeSerializer, UserRatingSerializer, FavoriteCardSerializer, \
+    build_category_children
+from .authentication import CachedTokenAuthentication, token_expired
+from .throttling import IPThrottle, ThrottleFirstMixin, UserThrottle, scoped
+from .timing import phase
+from .tokens import EMAIL_VERIFICATION_FIELD, PASSWORD_RESET_FIELD, issue_email_verification_token, \
+    issue_password_reset_token, password_reset_expired, users_by_token
+from .exporter import EXPORT_FORMATS, aiter_chunks, export_queryset, export_stream, parse_moment
+from .importer import ImportFileError, ListingImporter, detect_format, iter_rows
+from .pagination import ReviewCursorPagination
+from .projections import favorite_card_values, favorite_values, listing_values, message_values, \
+    project_favorite_cards, project_favorites, project_listings, project_messages, project_reviews, \
+    projections_enabled, review_values
+from .realtime import publish_read_receipt
+from .response_cache import CachedResponseMixin
 
 User = get_user_model()
 
@@ -61,48 +75,48 @@ def send_confirmation_email(user_email, token):
 
     try:
         # Отправляем email с подтверждением, используя настройки из settings.py
-        send_mail(
-            subject,  # Тема письма
-            message,  # Тело письма
-            settings.DEFAULT_FROM_EMAIL,  # Email, который у вас настроен в settings.py
-            [user_email],  # Получатель
-            fail_silently=False,  # Параметр для подавления ошибок
-        )
-        print(f"Письмо отправлено на {user_email}")
+        with phase('smtp'):
+            send_mail(
+                subject,  # Тема письма
+                message,  # Тело письма
+                settings.DEFAULT_FROM_EMAIL,  # Email, который у вас настроен в settings.py
+                [user_email],  # Получатель
+                fail_silently=False,  # Параметр для подавления ошибок
+            )
+        logger.info("Письмо подтверждения отправлено на %s", user_email)
     except Exception as e:
-        print(f"Ошибка при отправке письма: {e}")
-        logger.error(f"Ошибка при отправке письма: {e}")
+        logger.error("Ошибка при отправке письма на %s: %s", user_email, e)
 
 
 class RegisterView(APIView):
-    def post(self, request):
-        logger.info(f"Полученные данные: {request.data}")
+    throttle_classes = [UserThrottle]
+    user_throttle_scope = 'emails'
 
+    def post(self, request):
         serializer = RegisterSerializer(data=request.data)
 
         if serializer.is_valid():
             # Сохраняем пользователя
             user = serializer.save()
 
-            user.email_verification_token = str(uuid.uuid4())
-            user.email_verification_sent_at = timezone.now()
+            raw_token = issue_email_verification_token(user)
             user.save()
 
-            send_confirmation_email(user.email, user.email_verification_token)
+            send_confirmation_email(user.email, raw_token)
 
             # Ответ при успешной регистрации
             return Response({"message": "Пользователь зарегистрирован! Проверьте почту для подтверждения."},
                             status=status.HTTP_201_CREATED)
 
         # В случае ошибок валидации
-        logger.error(f"Ошибка валидации данных: {serializer.errors}")
+        logger.info("Ошибка валидации данных регистрации: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class ConfirmEmailView(View):
     def get(self, request, token):
         try:
-            user = User.objects.filter(email_verification_token=token).first()
+            user = users_by_token(EMAIL_VERIFICATION_FIELD, token).first()
 
             if not user:
                 return JsonResponse({"message": "Неверный токен подтверждения"}, status=400)
@@ -117,14 +131,16 @@ class ConfirmEmailView(View):
             return JsonResponse({"message": "Email успешно подтвержден!"})
 
         except Exception as e:
-            logger.error(f"Ошибка при подтверждении email: {str(e)}")
+            logger.exception("Ошибка при подтверждении email")
             return JsonResponse({"message": f"Ошибка сервера: {str(e)}"}, status=500)
 
 
 def csrf(request):
     return JsonResponse({'csrfToken': get_token(request)})
 
-class LoginView(APIView):
+class LoginView(ThrottleFirstMixin, APIView):
+    throttle_classes = [IPThrottle]
+    throttle_scope = 'login'
 
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
@@ -136,6 +152,9 @@ class LoginView(APIView):
         login(request, user)
 
         token, _ = Token.objects.get_or_create(user=user)
+        if token_expired(token):
+            token.delete()
+            token = Token.objects.create(user=user)
 
         response_data = {
             "message": "Авторизация успешна!",
@@ -152,6 +171,8 @@ class LoginView(APIView):
 
 
 class LogoutView(APIView):
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+
     def post(self, request):
         if not request.user.is_authenticated:
             return Response(
@@ -159,6 +180,9 @@ class LogoutView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Отзываем токен - сигнал сразу сбрасывает его из кеша аутентификации
+        if isinstance(request.auth, Token):
+            Token.objects.filter(pk=request.auth.pk).delete()
         logout(request)
         return Response(
             {"message": "Выход выполнен успешно!"},
@@ -167,7 +191,7 @@ class LogoutView(APIView):
 
 
 class ProfileView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes     = [IsAuthenticated]
 
     def get(self, request):
@@ -193,15 +217,29 @@ class ProfileView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ThrottleFirstMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Category.objects.filter(parent__isnull=True)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [IPThrottle]
+    throttle_scope = {'list': 'categories', 'retrieve': 'categories', 'filters': 'categories'}
+    query_budget = {'list': 4, 'retrieve': 4, 'filters': 3}
+    response_cache = {'list': 'categories', 'retrieve': 'categories', 'filters': 'categories'}
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related('filters')
 
     def get_serializer_class(self):
         if self.action == 'retrieve' or self.action == 'list':
             return CategoryTreeSerializer
         return CategorySerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # При генерации схемы (drf_yasg) дерево категорий не нужно - обходимся без БД
+        if (self.action == 'retrieve' or self.action == 'list') and not getattr(self, 'swagger_fake_view', False):
+            context['category_children'] = build_category_children()
+        return context
+
     @action(detail=True, methods=['get'])
     def filters(self, request, pk=None):
         category = self.get_object()
@@ -210,84 +248,116 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+def projected_response(view, queryset, values, project, serializer_class=None):
+    """Список через проекцию values() (projections.py) или, при API_PROJECTIONS=False, через сериализатор"""
+    if projections_enabled():
+        return Response(project(values(queryset)))
+    serializer_class = serializer_class or view.get_serializer_class()
+    return Response(serializer_class(queryset, many=True, context=view.get_serializer_context()).data)
+
+
+def with_listing_relations(queryset, prefix=''):
+    """Подгружает все, что читает ListingSerializer, фиксированным числом запросов"""
+    return queryset.select_related(
+        f'{prefix}user__role', f'{prefix}category'
+    ).prefetch_related(
+        f'{prefix}images',
+        f'{prefix}category__filters',
+        Prefetch(f'{prefix}listingcategory_set', queryset=ListingCategory.objects.select_related('category'))
+    )
+
+
+def get_descendant_category_ids(parent_id):
+    """ID категории и всех ее потомков: одно чтение пар (id, parent_id) вместо запроса на каждый узел"""
+    children = {}
+    for child_id, child_parent_id in Category.objects.values_list('id', 'parent_id'):
+        children.setdefault(child_parent_id, []).append(child_id)
+
+    ids = [parent_id]
+    stack = [parent_id]
+    while stack:
+        for child_id in children.get(stack.pop(), ()):
+            ids.append(child_id)
+            stack.append(child_id)
+    return ids
+
+
+def filter_listings(queryset, params):
+    """Фильтры выдачи объявлений из query-параметров: category (с потомками), city, price_min, price_max"""
+    category_id = params.get('category')
+    if category_id:
+        try:
+            # Получаем все ID в иерархии
+            category_ids = get_descendant_category_ids(int(category_id))
+
+            logger.debug("Фильтр по категориям: %s", category_ids)
+
+            # Фильтр для новых объявлений (прямое поле category)
+            q_new = Q(category_id__in=category_ids)
+            # Фильтр для старых объявлений (через listingcategory_set)
+            q_old = Q(listingcategory__category_id__in=category_ids)
+
+            queryset = queryset.filter(q_new | q_old).distinct()
+        except (ValueError, Category.DoesNotExist) as e:
+            logger.debug("Некорректный фильтр по категории %r: %s", category_id, e)
+
+    # Фильтрация по городу (только по address, так как location нет в модели)
+    city = params.get('city')
+    if city:
+        queryset = queryset.filter(address__icontains=city)
+
+    # Фильтрация по цене
+    price_min = params.get('price_min')
+    price_max = params.get('price_max')
+
+    if price_min:
+        try:
+            queryset = queryset.filter(price__gte=float(price_min))
+        except (ValueError, TypeError):
+            pass
+
+    if price_max:
+        try:
+            queryset = queryset.filter(price__lte=float(price_max))
+        except (ValueError, TypeError):
+            pass
+
+    return queryset
+
+
 # Представление для объявлений
-class ListingViewSet(viewsets.ModelViewSet):
+IMPORT_MAX_REPORTED_ERRORS = 1000
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_CONTENT_TYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+
+
+class ListingViewSet(ThrottleFirstMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Listing.objects.all().order_by('-created_at')
     serializer_class = ListingSerializer
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    # Публичная выдача и поиск - основная цель скрейперов, лимит по IP до любых запросов к БД
+    throttle_classes = [IPThrottle]
+    throttle_scope = {
+        'list': 'listings', 'by_category': 'listings', 'retrieve': 'listing_detail', 'export': 'listings_export',
+    }
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['title', 'description', 'address']
     parser_classes = [MultiPartParser, JSONParser]
+    query_budget = {'list': 6, 'retrieve': 5, 'my': 5, 'by_category': 5}
+    response_cache = {'list': 'listings', 'retrieve': 'listings', 'by_category': 'listings'}
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        queryset = queryset.select_related('user', 'category').prefetch_related(
-            'images',
-            Prefetch('listingcategory_set', queryset=ListingCategory.objects.select_related('category'))
-        )
-
-        category_id = self.request.GET.get('category')
-        if category_id:
-            from django.db.models import Q
-            from django.db.models.functions import Lower
-
-            def get_all_child_ids(parent_id):
-                ids = [parent_id]
-                children = Category.objects.filter(parent_id=parent_id)
-                for child in children:
-                    ids.extend(get_all_child_ids(child.id))
-                return ids
-
-            try:
-                # Получаем все ID в иерархии
-                category_ids = get_all_child_ids(int(category_id))
-
-                # Для отладки - выводим найденные ID категорий
-                print(f"Filtering by category IDs: {category_ids}")
-
-                # Фильтр для новых объявлений (прямое поле category)
-                q_new = Q(category_id__in=category_ids)
-                # Фильтр для старых объявлений (через listingcategory_set)
-                q_old = Q(listingcategory__category_id__in=category_ids)
-
-                queryset = queryset.filter(q_new | q_old).distinct()
-            except (ValueError, Category.DoesNotExist) as e:
-                print(f"Error filtering by category: {e}")
-                pass
-
-        # Фильтрация по городу (только по address, так как location нет в модели)
-        city = self.request.GET.get('city')
-        if city:
-            from django.db.models import Q
-            clean_city = city.replace('г.', '').replace('город', '').strip()
-            queryset = queryset.filter(
-                Q(address__icontains=city)
-            )
-
-        # Фильтрация по цене
-        price_min = self.request.GET.get('price_min')
-        price_max = self.request.GET.get('price_max')
-
-        if price_min:
-            try:
-                queryset = queryset.filter(price__gte=float(price_min))
-            except (ValueError, TypeError):
-                pass
-
-        if price_max:
-            try:
-                queryset = queryset.filter(price__lte=float(price_max))
-            except (ValueError, TypeError):
-                pass
-
-        return queryset
+        return filter_listings(with_listing_relations(super().get_queryset()), self.request.GET)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
+    def list(self, request, *args, **kwargs):
+        return projected_response(self, self.filter_queryset(self.get_queryset()), listing_values, project_listings)
+
     def create(self, request, *args, **kwargs):
         if not request.FILES.getlist('images'):
             logger.warning("Попытка создания объявления без изображений")
@@ -299,19 +369,79 @@ class ListingViewSet(viewsets.ModelViewSet):
         try:
             return super().create(request, *args, **kwargs)
         except Exception as e:
-            logger.error(f"Ошибка создания объявления: {str(e)}")
+            logger.error("Ошибка создания объявления: %s", e)
             error_msg = getattr(e, 'detail', str(e))
             return Response(
                 {"error": error_msg},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """Массовый импорт объявлений текущего пользователя из CSV/JSONL (поле file)"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': 'Необходимо загрузить файл'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fmt = detect_format(upload.name, request.data.get('format'))
+        except ValueError as e:
+            return Response({'format': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = []
+
+        def collect_error(line_no, row_errors):
+            # Отчет в ответе ограничен, полный отчет - в manage.py import_listings --errors
+            if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                errors.append({'row': line_no, 'errors': row_errors})
+
+        # Большие файлы Django держит во временном файле - читаем построчно, не загружая целиком
+        importer = ListingImporter(request.user, error_sink=collect_error)
+        try:
+            stats = importer.run(iter_rows(upload.file, fmt))
+        except ImportFileError as e:
+            # Пакеты до ошибки уже записаны - отчет о них возвращается вместе с ошибкой
+            return Response({'file': str(e), **importer.stats, 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {**stats, 'errors': errors},
+            status=status.HTTP_201_CREATED if stats['created'] else status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Потоковая выгрузка объявлений: ?type=jsonl|csv, ?gzip=1, ?created_after=, ?created_before=
+
+        Параметр называется type, а не format - format занят переключением рендереров DRF.
+        Под ASGI поток отдается асинхронным итератором (exporter.aiter_chunks), иначе Django
+        вычитал бы его в память до отправки.
+        """
+        fmt = request.query_params.get('type', 'jsonl').lower()
+        if fmt not in EXPORT_FORMATS:
+            return Response({'type': f"Допустимые значения: {', '.join(EXPORT_FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            created_after = parse_moment(request.query_params.get('created_after'))
+            created_before = parse_moment(request.query_params.get('created_before'), end_of_day=True)
+        except ValueError as e:
+            return Response({'created_at': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('gzip') in ('1', 'true')
+
+        stream = export_stream(
+            fmt, export_queryset(created_after, created_before), compress=compress, chunk_size=EXPORT_CHUNK_SIZE
+        )
+        if isinstance(request._request, ASGIRequest):
+            stream = aiter_chunks(stream)
+        filename = f'listings.{fmt}' + ('.gz' if compress else '')
+        response = StreamingHttpResponse(
+            stream, content_type='application/gzip' if compress else EXPORT_CONTENT_TYPES[fmt]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
     # Оставляем ваши кастомные actions без изменений
     @action(detail=False, methods=['get'])
     def my(self, request):
         listings = self.get_queryset().filter(user=request.user)
-        serializer = self.get_serializer(listings, many=True)
-        return Response(serializer.data)
+        return projected_response(self, listings, listing_values, project_listings)
 
     @action(detail=False, methods=['get'])
     def by_category(self, request):
@@ -319,8 +449,7 @@ class ListingViewSet(viewsets.ModelViewSet):
         queryset = self.get_queryset()
         if category_id:
             queryset = queryset.filter(category_id=category_id)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return projected_response(self, queryset, listing_values, project_listings)
 
 
 # Представление для изображений
@@ -331,32 +460,115 @@ class ImageViewSet(viewsets.ModelViewSet):
 
 
 # Представление для избранных
+FAVORITE_STATUS_MAX_IDS = 200
+
+
 class FavoriteViewSet(viewsets.ModelViewSet):
     queryset = Favorite.objects.all()
     serializer_class = FavoriteSerializer
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
+    throttle_classes = [UserThrottle]
+    user_throttle_scope = 'favorites'
+
+    query_budget = {'list': 6, 'compact': 3, 'favorite_status': 2}
 
     def get_queryset(self):
-        return super().get_queryset().filter(user=self.request.user).select_related('listing').prefetch_related('listing__images')
+        if getattr(self, 'swagger_fake_view', False):
+            return Favorite.objects.none()
+        return with_listing_relations(super().get_queryset().filter(user=self.request.user), prefix='listing__')
+
+    def list(self, request, *args, **kwargs):
+        return projected_response(self, self.filter_queryset(self.get_queryset()), favorite_values, project_favorites)
+
+    @action(detail=False, methods=['get'])
+    def compact(self, request):
+        """Избранное в виде карточек объявлений (без вложенных фильтров и профилей)"""
+        favorites = Favorite.objects.filter(user=request.user).select_related(
+            'listing__category', 'listing__user'
+        ).prefetch_related('listing__images').order_by('-id')
+        return projected_response(self, favorites, favorite_card_values, project_favorite_cards,
+                                  serializer_class=FavoriteCardSerializer)
+
+    @action(detail=False, methods=['get'], url_path='status')
+    def favorite_status(self, request):
+        """Какие из переданных объявлений (?ids=1,2,3) в избранном у пользователя"""
+        try:
+            ids = {int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()}
+        except ValueError:
+            return Response({'ids': 'Ожидается список id через запятую'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > FAVORITE_STATUS_MAX_IDS:
+            return Response(
+                {'ids': f'Не больше {FAVORITE_STATUS_MAX_IDS} id за запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Один запрос по уникальному индексу (user_id, listing_id)
+        favorited = Favorite.objects.filter(user=request.user, listing_id__in=ids).values_list('listing_id', flat=True)
+        return Response({'favorited': sorted(favorited)})
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
 class ReviewViewSet(viewsets.ModelViewSet):
-    queryset = Review.objects.all().order_by('-created_at')
+    queryset = Review.objects.all().order_by('-created_at', '-id')
     serializer_class = ReviewSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
+    query_budget = {'list': 2, 'retrieve': 2, 'feed': 2, 'summary': 2}
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        reviewed_id = self.request.query_params.get('reviewed')
-        if reviewed_id:
-            queryset = queryset.filter(reviewed_id=reviewed_id)
+        # reviewer нужен ReviewSerializer.get_reviewer - забираем его тем же запросом
+        queryset = super().get_queryset().select_related('reviewer')
+        for param in ('reviewed', 'reviewer'):
+            value = self.request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                queryset = queryset.filter(**{f'{param}_id': parse_id(value)})
+            except ValueError:
+                raise ValidationError({param: 'Ожидается целое положительное число'})
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        return projected_response(self, self.filter_queryset(self.get_queryset()), review_values, project_reviews)
+
+    @action(detail=False, methods=['get'], pagination_class=ReviewCursorPagination)
+    def feed(self, request):
+        """Курсорная лента отзывов о пользователе (?reviewed=) или от пользователя (?reviewer=)"""
+        if not (request.query_params.get('reviewed') or request.query_params.get('reviewer')):
+            return Response(
+                {'error': 'Укажите reviewed или reviewer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if projections_enabled():
+            # CursorPagination берет позицию и из словарей values()
+            page = self.paginate_queryset(review_values(self.get_queryset()))
+            return self.get_paginated_response(project_reviews(page))
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Рейтинг пользователя из сохраненных агрегатов, без подсчета по таблице отзывов"""
+        reviewed_id = request.query_params.get('reviewed')
+        if not reviewed_id:
+            return Response({'reviewed': 'Это поле обязательно'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            reviewed_id = parse_id(reviewed_id)
+        except ValueError:
+            return Response({'reviewed': 'Ожидается целое положительное число'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = User.objects.filter(pk=reviewed_id).only(
+            'id', 'rating_count', 'rating_sum', *User.RATING_HISTOGRAM_FIELDS
+        ).first()
+        if user is None:
+            return Response({'error': 'Пользователь не найден'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'user_id': user.id, **UserRatingSerializer(user).data})
+
     def perform_create(self, serializer):
         # Убедимся, что reviewed передается в данных запроса
         if 'reviewed' not in serializer.validated_data:
@@ -386,11 +598,70 @@ class CurrentUserView(APIView):
         })
 
 
+def parse_id(value):
+    """Положительный целый id из query-параметра или тела запроса; иначе ValueError"""
+    if not isinstance(value, (int, str)) or isinstance(value, bool):
+        raise ValueError(value)
+    value = int(value)
+    if value <= 0:
+        raise ValueError(value)
+    return value
+
+
+def _partner_query(messages, partner):
+    # Последнее сообщение - по created_at, а не по id: сидинг пишет сообщения с произвольными
+    # датами; при равных датах - большее id. Один проход с ROW_NUMBER() по собеседнику
+    rank = Window(RowNumber(), partition_by=F(partner), order_by=[F('created_at').desc(), F('id').desc()])
+    return messages.annotate(rank=rank).filter(rank=1).values_list(partner, 'id', 'created_at').order_by()
+
+
+def conversation_partner_queries(user):
+    """Тройки (собеседник, id последнего сообщения, его created_at) отдельно по отправленным и полученным"""
+    sent = _partner_query(Message.objects.filter(sender=user), 'receiver')
+    received = _partner_query(Message.objects.filter(receiver=user), 'sender')
+    return sent, received
+
+
+def last_message_ids(sent, received):
+    """{id собеседника: id последнего сообщения с ним}"""
+    latest = {}
+    for uid, last_id, last_at in chain(sent, received):
+        if uid not in latest or (last_at, last_id) > latest[uid]:
+            latest[uid] = (last_at, last_id)
+    return {uid: last_id for uid, (_, last_id) in latest.items()}
+
+
+def build_conversations(last_ids, messages, users):
+    convos = []
+    for uid, last_id in last_ids.items():
+        last_msg = messages.get(last_id)
+        u = users.get(uid)
+        if not last_msg or not u:
+            continue
+        convos.append({
+            'user': {
+                'id': u.id,
+                'username': u.username,
+            },
+            'last_message': MessageSerializer(last_msg).data
+        })
+
+    # отсортировать по дате последнего сообщения, чтобы сверху самые свежие
+    convos.sort(key=lambda x: x['last_message']['created_at'], reverse=True)
+    return convos
+
+
 class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.none()
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
+    throttle_classes = [UserThrottle]
+    user_throttle_scope = 'messages'
+    query_budget = {'list': 2, 'conversations': 5, 'unread_count': 2, 'mark_read': 2}
+    # Переписку опрашивает получатель, а не автор: закрепление после записи ему не поможет,
+    # поэтому новые сообщения читаем из основной БД
+    use_primary = {'list': True, 'unread_count': True}
 
     def get_queryset(self):
         user = self.request.user
@@ -402,62 +673,82 @@ class MessageViewSet(viewsets.ModelViewSet):
             ).order_by('created_at')
         return Message.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        return projected_response(self, self.filter_queryset(self.get_queryset()), message_values, project_messages)
+
     @action(detail=False, methods=['get'])
     def conversations(self, request):
-        user = request.user
-        # Все ID собеседников
-        sent_ids     = Message.objects.filter(sender=user).values_list('receiver', flat=True)
-        received_ids = Message.objects.filter(receiver=user).values_list('sender',   flat=True)
-        interlocutors = set(chain(sent_ids, received_ids))
-
-        convos = []
-        for uid in interlocutors:
-            # последнее сообщение с этим юзером
-            last_msg = Message.objects.filter(
-                Q(sender=user, receiver_id=uid) |
-                Q(sender_id=uid, receiver=user)
-            ).order_by('-created_at').first()
-            if not last_msg:
-                continue
-            u = User.objects.get(pk=uid)
-            convos.append({
-                'user': {
-                    'id': u.id,
-                    'username': u.username,
-                },
-                'last_message': MessageSerializer(last_msg).data
-            })
-
-        # отсортировать по дате последнего сообщения, чтобы сверху самые свежие
-        convos.sort(key=lambda x: x['last_message']['created_at'], reverse=True)
-        return Response(convos)
+        last_ids = last_message_ids(*conversation_partner_queries(request.user))
+        messages = Message.objects.in_bulk(last_ids.values())
+        users = User.objects.only('id', 'username').in_bulk(last_ids.keys())
+        return Response(build_conversations(last_ids, messages, users))
+
+    @action(detail=False, methods=['post'])
+    def mark_read(self, request):
+        """Отмечает прочитанными все входящие от собеседника (до up_to включительно) одним UPDATE"""
+        other_id = request.data.get('user_id')
+        up_to = request.data.get('up_to')
+        if not other_id:
+            return Response({'user_id': 'Это поле обязательно'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            other_id = parse_id(other_id)
+            up_to = parse_id(up_to) if up_to not in (None, '') else None
+        except ValueError:
+            return Response({'user_id': 'user_id и up_to должны быть целыми положительными числами'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        unread = Message.objects.filter(receiver=request.user, sender_id=other_id, is_read=False)
+        if up_to:
+            unread = unread.filter(id__lte=up_to)
+        updated = unread.update(is_read=True)
+
+        if updated:
+            reader_id = request.user.id
+            transaction.on_commit(lambda: publish_read_receipt(reader_id, other_id, up_to=up_to))
+        return Response({'updated': updated})
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        # COUNT по частичному индексу message_unread_idx - один дешевый запрос для бейджа
+        unread = Message.objects.filter(receiver=request.user, is_read=False)
+        other_id = request.query_params.get('user_id')
+        if other_id:
+            try:
+                unread = unread.filter(sender_id=parse_id(other_id))
+            except ValueError:
+                return Response({'user_id': 'Ожидается целое положительное число'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        return Response({'unread': unread.count()})
 
     def perform_create(self, serializer):
         serializer.save(sender=self.request.user)
 
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 class MyListingsView(generics.ListAPIView):
     serializer_class = ListingSerializer
+    query_budget = 6
 
     def get_queryset(self):
-        return Listing.objects.filter(user=self.request.user)
+        return with_listing_relations(Listing.objects.filter(user=self.request.user))
+
+    def list(self, request, *args, **kwargs):
+        return projected_response(self, self.filter_queryset(self.get_queryset()), listing_values, project_listings)
 
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 class MyFavoritesView(generics.ListAPIView):
     serializer_class = FavoriteSerializer
+    query_budget = 6
 
     def get_queryset(self):
-        return Favorite.objects.filter(
-            user=self.request.user
-        ).select_related(
-            'listing',
-            'listing__user'
-        ).prefetch_related(
-            'listing__images'
+        return with_listing_relations(
+            Favorite.objects.filter(user=self.request.user), prefix='listing__'
         ).order_by('-id')
 
+    def list(self, request, *args, **kwargs):
+        return projected_response(self, self.filter_queryset(self.get_queryset()), favorite_values, project_favorites)
+
 
 class FilterOptionsView(APIView):
     def get(self, request, category_id):
@@ -490,6 +781,7 @@ class CategoryFiltersView(APIView):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([scoped('password_reset'), scoped('emails', base=UserThrottle)])
 def request_password_reset(request):
     email = request.data.get('email')
 
@@ -503,20 +795,19 @@ def request_password_reset(request):
         user = User.objects.get(email=email)
 
         # Генерируем новый токен
-        token = str(uuid.uuid4())
-        user.password_reset_token = token
-        user.password_reset_token_created = timezone.now()
+        token = issue_password_reset_token(user)
         user.save()
 
         # Отправляем email
         reset_url = f"{settings.FRONTEND_URL}/reset-password/{token}/"
-        send_mail(
-            'Восстановление пароля',
-            f'Для сброса пароля перейдите по ссылке: {reset_url}',
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-        )
+        with phase('smtp'):
+            send_mail(
+                'Восстановление пароля',
+                f'Для сброса пароля перейдите по ссылке: {reset_url}',
+                settings.DEFAULT_FROM_EMAIL,
+                [user.email],
+                fail_silently=False,
+            )
 
         return Response(
             {'message': 'Письмо с инструкциями отправлено на ваш email'},
@@ -529,7 +820,7 @@ def request_password_reset(request):
             status=status.HTTP_404_NOT_FOUND
         )
     except Exception as e:
-        logger.error(f"Ошибка при запросе сброса пароля: {str(e)}")
+        logger.exception("Ошибка при запросе сброса пароля")
         return Response(
             {'error': 'Ошибка при обработке запроса'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -540,10 +831,10 @@ def request_password_reset(request):
 @permission_classes([AllowAny])
 def validate_reset_token(request, token):
     try:
-        user = User.objects.get(password_reset_token=token)
+        user = users_by_token(PASSWORD_RESET_FIELD, token).get()
 
         # Проверяем срок действия токена (24 часа)
-        if timezone.now() > user.password_reset_token_created + timedelta(hours=24):
+        if password_reset_expired(user):
             return Response(
                 {'valid': False, 'error': 'Срок действия ссылки истек'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -578,10 +869,10 @@ def reset_password(request, token):
         )
 
     try:
-        user = User.objects.get(password_reset_token=token)
+        user = users_by_token(PASSWORD_RESET_FIELD, token).get()
 
         # Проверка срока действия токена (24 часа)
-        if timezone.now() > user.password_reset_token_created + timedelta(hours=24):
+        if password_reset_expired(user):
             return Response(
                 {'error': 'Срок действия токена истёк'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -590,7 +881,10 @@ def reset_password(request, token):
         # Установка нового пароля
         user.set_password(new_password)
         user.password_reset_token = None
+        user.password_reset_token_created = None
         user.save()
+        # Старый токен мог утечь вместе с паролем
+        Token.objects.filter(user=user).delete()
 
         return Response(
             {'message': 'Пароль успешно изменён'},